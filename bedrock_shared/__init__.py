@@ -0,0 +1,10 @@
+"""
+Shared helpers used by the sample apps and notebooks of this repository.
+
+The apps are launched from their own folder (e.g. `streamlit run app.py`), so they add the
+repository root to sys.path before importing this package.
+"""
+from .clients import get_client, get_bedrock_runtime_client, build_client_config
+from .response_cache import ResponseCache, cached_converse, get_response_cache
+from .embeddings import EmbeddingEngine, get_embedding_engine
+from .vector_store import MmapVectorStore, save_vector_store, read_store_version
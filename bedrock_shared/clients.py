@@ -0,0 +1,81 @@
+"""
+Pooled, reusable boto3 clients.
+
+Creating a boto3 client costs tens of milliseconds (loading service models, resolving
+credentials), and every new client opens new TLS connections. Clients are thread-safe, so we
+build one per (service, region, profile, config) and reuse it for the life of the process.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# Match the connection pool to the number of threads that may share a client.
+# Same default as concurrent.futures.ThreadPoolExecutor.
+DEFAULT_MAX_POOL_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_POOL_CONNECTIONS', min(32, (os.cpu_count() or 1) + 4)))
+
+DEFAULT_CONFIG = {
+    'max_pool_connections': DEFAULT_MAX_POOL_CONNECTIONS,
+    'retries': {'mode': 'adaptive', 'max_attempts': 5},
+    'tcp_keepalive': True,
+    'connect_timeout': 5,
+    # Long generations (and streams) can take a while before the response completes
+    'read_timeout': 300,
+}
+
+_sessions = {}
+_clients = {}
+_lock = threading.Lock()
+
+
+def build_client_config(**overrides):
+    """Return a botocore Config with the repository defaults, updated with overrides"""
+    return Config(**{**DEFAULT_CONFIG, **overrides})
+
+
+def _freeze(value):
+    """Turn nested dicts/lists into a hashable cache key"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def get_client(service_name='bedrock-runtime', region_name=None, profile_name=None, **config_overrides):
+    """
+    Return a cached boto3 client.
+
+    Args:
+        service_name: AWS service; e.g. 'bedrock-runtime', 'bedrock', 'bedrock-agent-runtime'.
+        region_name: AWS region. Defaults to the session's region.
+        profile_name: AWS CLI profile. Defaults to the default credential chain.
+        config_overrides: botocore Config arguments that override DEFAULT_CONFIG.
+
+    Returns:
+        A boto3 client, shared by every caller asking for the same arguments.
+    """
+    key = (service_name, region_name, profile_name, _freeze(config_overrides))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # boto3 Sessions are not thread-safe, so they are only used under the lock
+            session = _sessions.get(profile_name)
+            if session is None:
+                session = boto3.Session(profile_name=profile_name)
+                _sessions[profile_name] = session
+            client = session.client(service_name=service_name,
+                                    region_name=region_name,
+                                    config=build_client_config(**config_overrides))
+            _clients[key] = client
+    return client
+
+
+def get_bedrock_runtime_client(region_name=None, profile_name=None, **config_overrides):
+    """Return the cached 'bedrock-runtime' client for a region and profile"""
+    return get_client('bedrock-runtime', region_name, profile_name, **config_overrides)
@@ -0,0 +1,185 @@
+"""
+Batched, concurrent embedding engine for Amazon Titan Text Embeddings on Bedrock.
+
+Titan embeddings are one text per invoke_model call, so throughput comes from:
+  - Deduplicating the input texts (each distinct text is embedded once).
+  - A content-hash cache on disk (SQLite), so repeated texts never hit Bedrock again.
+  - Fanning out the remaining texts to a bounded thread pool, with a token bucket that keeps
+    the request rate under the account quota (throttling retries are left to the client's
+    adaptive retry mode; see clients.py).
+
+Results come back as one contiguous float32 NumPy matrix (row i = texts[i]) instead of lists of
+Python floats.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from .clients import get_bedrock_runtime_client
+
+DEFAULT_EMBEDDING_MODEL_ID = "amazon.titan-embed-text-v2:0"
+
+
+class TokenBucket:
+    """Thread-safe token bucket: at most `rate` acquisitions per second on average, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by a hash of (model, settings, text)"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys found in the cache"""
+        found = {}
+        with self._lock:
+            # Stay below SQLite's limit on the number of query parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                for key, blob in self._db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch):
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, items):
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                 [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items])
+            self._db.commit()
+
+
+class EmbeddingEngine:
+    """
+    Embeds iterables of texts with dedupe, an on-disk cache, bounded concurrency and rate limiting.
+
+    Args:
+        model_id: Titan text embeddings model ID.
+        dimensions: Output size (Titan v2 supports 256, 512 or 1024).
+        normalize: Ask Titan for unit-length vectors (cosine similarity == dot product).
+        cache_path: SQLite file for the embedding cache; None disables it.
+        max_workers: Maximum concurrent invoke_model calls.
+        requests_per_second: Token bucket rate for invoke_model calls.
+        client: bedrock-runtime client; defaults to the pooled client for region_name.
+    """
+
+    def __init__(self, model_id=DEFAULT_EMBEDDING_MODEL_ID, dimensions=1024, normalize=True, cache_path=None,
+                 max_workers=8, requests_per_second=20.0, client=None, region_name=None):
+        self.model_id = model_id
+        self.dimensions = dimensions
+        self.normalize = normalize
+        self.client = client or get_bedrock_runtime_client(region_name=region_name,
+                                                           max_pool_connections=max(max_workers, 10))
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.calls = 0
+        self.cache_hits = 0
+        # Guards the counters: embed() runs on several threads at once (pool workers, Streamlit sessions)
+        self._lock = threading.Lock()
+
+    def _cache_key(self, text):
+        key = json.dumps([self.model_id, self.dimensions, self.normalize, text])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _invoke(self, text):
+        self.rate_limiter.acquire()
+        body = json.dumps({"inputText": text, "dimensions": self.dimensions, "normalize": self.normalize})
+        response = self.client.invoke_model(body=body, modelId=self.model_id,
+                                            accept="application/json", contentType="application/json")
+        with self._lock:
+            self.calls += 1
+        return np.asarray(json.loads(response["body"].read())["embedding"], dtype=np.float32)
+
+    def embed(self, texts):
+        """
+        Embed an iterable of texts.
+
+        Returns:
+            np.ndarray of shape (len(texts), dimensions) and dtype float32; row i is the vector of texts[i].
+        """
+        texts = list(texts)
+        unique_texts = list(dict.fromkeys(texts))
+        keys = {text: self._cache_key(text) for text in unique_texts}
+
+        vectors = self.cache.get_many(list(keys.values())) if self.cache else {}
+        with self._lock:
+            self.cache_hits += len(vectors)
+        missing = [text for text in unique_texts if keys[text] not in vectors]
+
+        if missing:
+            computed, error = [], None
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                futures = {pool.submit(self._invoke, text): text for text in missing}
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    try:
+                        computed.append((futures[future], future.result()))
+                    except Exception as e:
+                        if error is None:
+                            error = e
+                            # Don't start the texts still queued; the ones in flight finish and are kept
+                            for pending in futures:
+                                pending.cancel()
+            # Cache what was embedded before re-raising, so a retry only embeds the rest
+            if self.cache and computed:
+                self.cache.put_many([(keys[text], vector) for text, vector in computed])
+            if error is not None:
+                raise error
+            for text, vector in computed:
+                vectors[keys[text]] = vector
+
+        matrix = np.empty((len(texts), self.dimensions), dtype=np.float32)
+        for i, text in enumerate(texts):
+            matrix[i] = vectors[keys[text]]
+        return matrix
+
+    def embed_query(self, text):
+        """Embed a single text; returns a float32 vector"""
+        return self.embed([text])[0]
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_embedding_engine(model_id=DEFAULT_EMBEDDING_MODEL_ID, region_name=None, **kwargs):
+    """Return the process-wide EmbeddingEngine for a model and region (kwargs only apply on first creation)"""
+    key = (model_id, region_name)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _engines[key] = EmbeddingEngine(model_id=model_id, region_name=region_name, **kwargs)
+    return engine
@@ -0,0 +1,267 @@
+"""
+Response cache in front of the Converse / ConverseStream APIs.
+
+Users keep asking the same FAQ-type questions; every repeat costs a full model round trip and
+its tokens. Responses are cached in SQLite, keyed by:
+    (model ID, system prompt hash, inference config, normalized message history)
+
+Two lookup tiers:
+  - Exact: hash of the normalized request.
+  - Semantic (optional, when an embed_fn is given): among cached requests with the same model,
+    system prompt, inference config and earlier history, the one whose last user message is the
+    most similar to the new one, if the cosine similarity is above a threshold.
+
+Semantic lookups score all the partition's embeddings with one matrix-vector product, and the
+embedding of the last user message is kept in a small LRU, so the put() after a miss doesn't
+call the embedding model again.
+
+Entries expire after a TTL, and the least recently used ones are evicted beyond max_entries.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a message, used for cache keys"""
+    return _WHITESPACE.sub(' ', text).strip().casefold()
+
+
+def _normalize_messages(messages):
+    """Keep only what affects the answer: roles and normalized text / tool blocks"""
+    normalized = []
+    for message in messages:
+        content = []
+        for block in message.get('content', []):
+            if 'text' in block:
+                content.append({'text': normalize_text(block['text'])})
+            else:
+                content.append(block)
+        normalized.append({'role': message['role'], 'content': content})
+    return normalized
+
+
+def _hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _last_user_text(messages):
+    for message in reversed(messages):
+        if message['role'] == 'user':
+            return ' '.join(block['text'] for block in message.get('content', []) if 'text' in block)
+    return ''
+
+
+def _best_match(query, candidates):
+    """(index, cosine similarity) of the candidate blob most similar to query, or (None, -1.0)"""
+    # Blobs of another dimension (e.g. written with a different embedding model) are skipped
+    indexes = [i for i, (_, blob, _) in enumerate(candidates) if len(blob) == query.nbytes]
+    query_norm = np.linalg.norm(query)
+    if not indexes or not query_norm:
+        return None, -1.0
+    matrix = np.frombuffer(b''.join(candidates[i][1] for i in indexes), dtype=np.float32).reshape(len(indexes), -1)
+    norms = np.linalg.norm(matrix, axis=1) * query_norm
+    scores = np.divide(matrix @ query, norms, out=np.zeros(len(indexes), dtype=np.float32), where=norms > 0)
+    best = int(np.argmax(scores))
+    return indexes[best], float(scores[best])
+
+
+class ResponseCache:
+    """
+    SQLite-backed LRU + TTL cache of model responses, with an optional embedding-similarity tier.
+
+    Args:
+        path: SQLite file (use ':memory:' for a process-local cache).
+        ttl_seconds: Entries older than this are ignored and purged.
+        max_entries: Least recently used entries beyond this are evicted.
+        embed_fn: Optional callable(text) -> list[float] that enables the semantic tier.
+        similarity_threshold: Minimum cosine similarity for a semantic hit.
+        embedding_cache_size: Recent message embeddings kept in memory (a miss embeds once for get and put).
+    """
+
+    def __init__(self, path, ttl_seconds=24 * 3600, max_entries=10000, embed_fn=None, similarity_threshold=0.95,
+                 embedding_cache_size=256):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.embed_fn = embed_fn
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.embedding_cache_size = embedding_cache_size
+        self._embeddings = OrderedDict()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                partition TEXT NOT NULL,
+                embedding BLOB,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_partition ON responses (partition)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        self._db.commit()
+
+    @staticmethod
+    def make_keys(model_id, system, messages, inference_config=None, additional_model_fields=None):
+        """
+        Return (exact key, partition key) for a request.
+
+        The partition covers everything except the last user message, so semantic matches are only
+        considered between requests that share model, system prompt, inference config and history.
+        """
+        normalized = _normalize_messages(messages)
+        context = {
+            'model_id': model_id,
+            'system': _hash(system or []),
+            'inference_config': inference_config or {},
+            'additional_model_fields': additional_model_fields or {},
+        }
+        partition = _hash({**context, 'history': normalized[:-1]})
+        exact = _hash({**context, 'messages': normalized})
+        return exact, partition
+
+    def _embed(self, messages):
+        if not self.embed_fn:
+            return None
+        text = normalize_text(_last_user_text(messages))
+        if not text:
+            return None
+        with self._lock:
+            embedding = self._embeddings.get(text)
+            if embedding is not None:
+                self._embeddings.move_to_end(text)
+                return embedding
+        embedding = np.asarray(self.embed_fn(text), dtype=np.float32)
+        with self._lock:
+            self._embeddings[text] = embedding
+            while len(self._embeddings) > self.embedding_cache_size:
+                self._embeddings.popitem(last=False)
+        return embedding
+
+    def get(self, model_id, system, messages, inference_config=None, additional_model_fields=None):
+        """Return the cached response for a request, or None"""
+        exact, partition = self.make_keys(model_id, system, messages, inference_config, additional_model_fields)
+        now = time.time()
+        min_created = now - self.ttl_seconds
+
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ? AND created_at >= ?",
+                                   (exact, min_created)).fetchone()
+            if row:
+                self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, exact))
+                self._db.commit()
+                self.hits += 1
+                return json.loads(row[0])
+
+        query_embedding = self._embed(messages)
+        if query_embedding is not None:
+            with self._lock:
+                candidates = self._db.execute(
+                    "SELECT key, embedding, response FROM responses "
+                    "WHERE partition = ? AND created_at >= ? AND embedding IS NOT NULL",
+                    (partition, min_created)).fetchall()
+            best, score = _best_match(query_embedding, candidates)
+            if best is not None and score >= self.similarity_threshold:
+                best_key, _, best_response = candidates[best]
+                with self._lock:
+                    self._db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, best_key))
+                    self._db.commit()
+                    self.hits += 1
+                    self.semantic_hits += 1
+                return json.loads(best_response)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, model_id, system, messages, response, inference_config=None, additional_model_fields=None):
+        """Store a JSON-serializable response for a request"""
+        exact, partition = self.make_keys(model_id, system, messages, inference_config, additional_model_fields)
+        embedding = self._embed(messages)
+        now = time.time()
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, partition, embedding, response, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (exact, partition, embedding.tobytes() if embedding is not None else None,
+                 json.dumps(response, default=str), now, now))
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        """Purge expired entries and the least recently used ones over capacity. Caller holds the lock."""
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "  SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+
+# Only the parts of a Converse response needed to replay it (no ResponseMetadata / HTTP headers)
+_CACHED_RESPONSE_FIELDS = ('output', 'stopReason', 'usage', 'metrics')
+# Complete turns only: a max_tokens, guardrail_intervened or content_filtered answer must not be replayed
+_CACHEABLE_STOP_REASONS = ('end_turn', 'tool_use')
+
+
+def cached_converse(bedrock_client, response_cache, **converse_kwargs):
+    """
+    Drop-in for bedrock_client.converse(**converse_kwargs) that goes through a ResponseCache.
+
+    A cached response has the same shape as a live one, plus 'cacheHit': True. Only responses
+    that end a complete turn (end_turn, tool_use) are stored.
+    """
+    lookup = dict(model_id=converse_kwargs['modelId'],
+                  system=converse_kwargs.get('system'),
+                  messages=converse_kwargs['messages'],
+                  inference_config={'inferenceConfig': converse_kwargs.get('inferenceConfig'),
+                                    'toolConfig': converse_kwargs.get('toolConfig')},
+                  additional_model_fields=converse_kwargs.get('additionalModelRequestFields'))
+
+    cached = response_cache.get(**lookup)
+    if cached is not None:
+        return {**cached, 'cacheHit': True}
+
+    response = bedrock_client.converse(**converse_kwargs)
+    if response.get('stopReason') in _CACHEABLE_STOP_REASONS:
+        response_cache.put(response={k: response[k] for k in _CACHED_RESPONSE_FIELDS if k in response},
+                           **lookup)
+    return response
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(path, **kwargs):
+    """Return the process-wide ResponseCache for a SQLite file (kwargs only apply on first creation)"""
+    path = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(path)
+        if cache is None:
+            cache = _caches[path] = ResponseCache(path, **kwargs)
+    return cache
@@ -0,0 +1,181 @@
+"""
+Compact on-disk embedding store, opened with memory mapping and without pickle.
+
+A store is a folder:
+    manifest.json      format version, index version, dtype, dimensions, count
+    vectors.npy        (count, dimensions) matrix: float32, or float16 / int8 when quantized
+    scales.npy         per-row float32 scales (int8 only): vector ~= int8_row * scale
+    text_offsets.npy   int64 (count + 1) byte offsets into texts.bin
+    texts.bin          UTF-8 chunk texts, concatenated
+    ids.json           chunk IDs, in row order
+    metadata.json      metadata as columns: {"source": [...], "page": [...], ...}
+
+Opening a store memory-maps the .npy/.bin files (zero-copy; pages are loaded on demand and shared
+between worker processes through the OS page cache), and only parses the small JSON sidecars.
+Nothing is unpickled, so opening an index cannot execute code.
+"""
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+SUPPORTED_DTYPES = ('float32', 'float16', 'int8')
+
+
+def swap_directory(tmp_path, path):
+    """Replace the folder at path with tmp_path, so readers only ever see a complete folder"""
+    old_path = f"{path}.old-{uuid.uuid4().hex}"
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+def read_store_version(path):
+    """Return the version string of the store at path, or None if there is no store"""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)['version']
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def _metadata_columns(metadatas):
+    columns = {}
+    for i, metadata in enumerate(metadatas):
+        for key, value in metadata.items():
+            columns.setdefault(key, [None] * len(metadatas))[i] = value
+    return columns
+
+
+def save_vector_store(path, ids, vectors, texts, metadatas=None, dtype='float32', extra_files=None):
+    """
+    Write a store atomically (to a temporary folder that is then swapped into place).
+
+    Args:
+        path: Store folder.
+        ids: Chunk IDs, one per row.
+        vectors: Array-like of shape (count, dimensions).
+        texts: Chunk texts, one per row.
+        metadatas: Optional list of JSON-serializable dicts, one per row.
+        dtype: 'float32', or 'float16' / 'int8' to quantize the vectors (2x / 4x smaller).
+        extra_files: Optional {file name: text} written alongside the store (e.g. a manifest).
+
+    Returns:
+        The new store version.
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype must be one of {SUPPORTED_DTYPES}, got {dtype!r}")
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    count = len(ids)
+    if count == 0 and vectors.ndim != 2:
+        vectors = vectors.reshape(0, 0)
+    if vectors.ndim != 2 or vectors.shape[0] != count or len(texts) != count:
+        raise ValueError("ids, vectors and texts must have the same number of rows")
+    metadatas = metadatas or [{} for _ in range(count)]
+
+    tmp_path = f"{path}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        stored = np.round(vectors / scales[:, None]).astype(np.int8)
+        np.save(os.path.join(tmp_path, "scales.npy"), scales.astype(np.float32))
+    else:
+        stored = vectors.astype(dtype)
+    np.save(os.path.join(tmp_path, "vectors.npy"), stored)
+
+    encoded = [text.encode('utf-8') for text in texts]
+    offsets = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(tmp_path, "text_offsets.npy"), offsets)
+    with open(os.path.join(tmp_path, "texts.bin"), 'wb') as f:
+        for b in encoded:
+            f.write(b)
+
+    with open(os.path.join(tmp_path, "ids.json"), 'w', encoding='utf-8') as f:
+        json.dump(list(ids), f)
+    with open(os.path.join(tmp_path, "metadata.json"), 'w', encoding='utf-8') as f:
+        json.dump(_metadata_columns(metadatas), f)
+    for name, content in (extra_files or {}).items():
+        with open(os.path.join(tmp_path, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    version = uuid.uuid4().hex
+    # Written last: a folder without a manifest is never considered a store
+    with open(os.path.join(tmp_path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'format_version': FORMAT_VERSION, 'version': version, 'dtype': dtype,
+                   'dimensions': int(vectors.shape[1]), 'count': count}, f)
+
+    swap_directory(tmp_path, path)
+    return version
+
+
+class MmapVectorStore:
+    """Read-only, memory-mapped view of a store written by save_vector_store"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format {manifest['format_version']}")
+
+        self.version = manifest['version']
+        self.dtype = manifest['dtype']
+        self.dimensions = manifest['dimensions']
+        self.count = manifest['count']
+
+        if self.count:
+            self.raw_vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+            self._text_offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode='r')
+            texts_file = os.path.join(path, "texts.bin")
+            # An empty file cannot be memory-mapped (all texts empty)
+            self._texts = (np.memmap(texts_file, dtype=np.uint8, mode='r') if os.path.getsize(texts_file)
+                           else np.zeros(0, dtype=np.uint8))
+        else:
+            self.raw_vectors = np.zeros((0, self.dimensions), dtype=self.dtype)
+            self._text_offsets = np.zeros(1, dtype=np.int64)
+            self._texts = np.zeros(0, dtype=np.uint8)
+        self.scales = (np.load(os.path.join(path, "scales.npy"), mmap_mode='r')
+                       if self.dtype == 'int8' and self.count else None)
+
+        with open(os.path.join(path, "ids.json"), 'r', encoding='utf-8') as f:
+            self.ids = json.load(f)
+        with open(os.path.join(path, "metadata.json"), 'r', encoding='utf-8') as f:
+            self._metadata_columns = json.load(f)
+
+    def __len__(self):
+        return self.count
+
+    def vectors(self, rows=None):
+        """
+        Return vectors as float32.
+
+        For float32 stores without `rows` this is the memory map itself (zero-copy); quantized
+        stores are dequantized, so prefer passing the rows you need.
+        """
+        raw = self.raw_vectors if rows is None else self.raw_vectors[rows]
+        if self.dtype == 'float32':
+            return raw
+        if self.dtype == 'float16':
+            return raw.astype(np.float32)
+        scales = self.scales if rows is None else self.scales[rows]
+        return raw.astype(np.float32) * np.asarray(scales)[:, None]
+
+    def text(self, row):
+        start, end = self._text_offsets[row], self._text_offsets[row + 1]
+        return bytes(self._texts[start:end]).decode('utf-8')
+
+    def metadata(self, row):
+        return {key: column[row] for key, column in self._metadata_columns.items() if column[row] is not None}
+
+    def rows(self, rows):
+        """Return [(id, text, metadata)] for the given row numbers"""
+        return [(self.ids[row], self.text(row), self.metadata(row)) for row in rows]
@@ -1,16 +1,16 @@
 # This Image Workshop and code credits: https://catalog.workshops.aws/building-with-amazon-bedrock/en-US
 import os
-import boto3
+import sys
 import json
 import base64
 from io import BytesIO
 
-# SDK Init
-session = boto3.Session() 
-bedrock = session.client(
-    service_name='bedrock-runtime',
-    region_name="us-west-2"
-) 
+# Make the repository-level bedrock_shared package importable when running from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared import get_bedrock_runtime_client
+
+# SDK Init: pooled client, shared with any other module in this process using the same region
+bedrock = get_bedrock_runtime_client(region_name="us-west-2")
 
 def get_image_response(prompt_content, bedrock_model_id = "stability.stable-image-ultra-v1:1"):
     """
@@ -3,9 +3,14 @@
   Some sections of this Streamlit app have been obtained from: https://github.com/aws-samples/genai-quickstart-pocs
 """
 import streamlit as st
-import boto3
+import functools
+import os
+import uuid
 from utils import *
-from invoke_model_converse_stream_api import stream_conversation
+from invoke_model_converse_stream_api import stream_conversation, cached_stream_conversation
+from bedrock_shared import get_bedrock_runtime_client, get_response_cache
+from async_converse_stream import get_async_backend
+from conversation_store import get_conversation_store
 
 # Title displayed on the streamlit web app
 st.title(f"""        🚀 :rainbow[ChatLab]""")
@@ -15,6 +20,19 @@ st.title(f"""        🚀 :rainbow[ChatLab]""")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# Each browser session gets its own conversation history for the model (see conversation_store.py)
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
+conversation_store = get_conversation_store()
+
+# Set CHATBOT_ASYNC_BACKEND=1 to read Bedrock streams on the shared asyncio backend (see async_converse_stream.py)
+stream_fn = get_async_backend().stream if os.environ.get('CHATBOT_ASYNC_BACKEND') == '1' else stream_conversation
+
+# Set CHATBOT_RESPONSE_CACHE=1 to replay answers to repeated questions from a local cache (no Bedrock call)
+if os.environ.get('CHATBOT_RESPONSE_CACHE') == '1':
+    response_cache = get_response_cache(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'responses.sqlite'))
+    stream_fn = functools.partial(cached_stream_conversation, response_cache, stream_fn=stream_fn)
+
 # Initialize session state for default values
 if 'region' not in st.session_state:
     st.session_state['region'] = 'us-west-2'
@@ -84,8 +102,8 @@ with st.sidebar:
         st.warning("No compatible models found for the selected provider.")
         selected_model_id = None
 
-    # Create a Bedrock agent runtime client
-    bedrock_client = boto3.client(service_name='bedrock-runtime', region_name=selected_region)
+    # Reuse the process-wide Bedrock runtime client for this region (see bedrock_shared/clients.py)
+    bedrock_client = get_bedrock_runtime_client(region_name=selected_region)
 
     # Temperature selection
     temperature = st.slider("**Temperature**", 0.1, 1.0, 0.5, step=0.1)
@@ -116,13 +134,17 @@ if question := st.chat_input("Message Claude"):
         # making sure there are no messages present when generating the answer
         message_placeholder = st.empty()
         
+        # trim the history first, so the summary includes the turns dropped for this question
+        history, session_system_prompt = conversation_store.get_context(st.session_state.session_id, system_prompt)
+
         # calling the invoke_llm_with_streaming to generate the answer as a generator object, and using
-        answer = st.write_stream(stream_conversation(bedrock_client=bedrock_client, 
-                                                     question=question, 
-                                                     system_prompt=system_prompt, 
-                                                     input_model_id=selected_model_id, 
-                                                     input_temperature=temperature, 
-                                                     input_top_k=top_k))
+        answer = st.write_stream(stream_fn(bedrock_client=bedrock_client, 
+                                            question=question, 
+                                            system_prompt=session_system_prompt, 
+                                            input_model_id=selected_model_id, 
+                                            input_temperature=temperature, 
+                                            input_top_k=top_k,
+                                            messages=history))
     
     # appending the final answer to the session state
     st.session_state.messages.append({"role": "assistant",
@@ -1,7 +1,12 @@
 import streamlit as st
-import boto3
+import functools
+import os
+import uuid
 from utils import *
-from invoke_model_converse_stream_api import stream_conversation
+from invoke_model_converse_stream_api import stream_conversation, cached_stream_conversation
+from bedrock_shared import get_bedrock_runtime_client, get_response_cache
+from async_converse_stream import get_async_backend
+from conversation_store import get_conversation_store
 
 # Page configuration
 st.set_page_config(
@@ -71,11 +76,24 @@ st.markdown("<div style='text-align: center; color: #666; margin-bottom: 2rem;'>
 # Session state initialization
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = str(uuid.uuid4())
 if 'region' not in st.session_state:
     st.session_state['region'] = 'us-west-2'
 if 'provider' not in st.session_state:
     st.session_state['provider'] = 'Anthropic'
 
+# Model-side history per session, bounded by a token budget (see conversation_store.py)
+conversation_store = get_conversation_store()
+
+# Set CHATBOT_ASYNC_BACKEND=1 to read Bedrock streams on the shared asyncio backend (see async_converse_stream.py)
+stream_fn = get_async_backend().stream if os.environ.get('CHATBOT_ASYNC_BACKEND') == '1' else stream_conversation
+
+# Set CHATBOT_RESPONSE_CACHE=1 to replay answers to repeated questions from a local cache (no Bedrock call)
+if os.environ.get('CHATBOT_RESPONSE_CACHE') == '1':
+    response_cache = get_response_cache(os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'responses.sqlite'))
+    stream_fn = functools.partial(cached_stream_conversation, response_cache, stream_fn=stream_fn)
+
 # Enhanced sidebar
 with st.sidebar:
     st.markdown("### ⚙️ Model Configuration")
@@ -128,7 +146,7 @@ with st.sidebar:
         st.error("❌ No compatible models found")
         selected_model_id = None
 
-    bedrock_client = boto3.client(service_name='bedrock-runtime', region_name=selected_region)
+    bedrock_client = get_bedrock_runtime_client(region_name=selected_region)
 
     # Parameters section with better organization
     st.markdown("### 🎛️ Parameters")
@@ -164,13 +182,16 @@ if question := st.chat_input("Type your message here..."):
     
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
-        answer = st.write_stream(stream_conversation(
+        # Trim the history first, so the summary includes the turns dropped for this question
+        history, session_system_prompt = conversation_store.get_context(st.session_state.session_id, system_prompt)
+        answer = st.write_stream(stream_fn(
             bedrock_client=bedrock_client,
             question=question,
-            system_prompt=system_prompt,
+            system_prompt=session_system_prompt,
             input_model_id=selected_model_id,
             input_temperature=temperature,
-            input_top_k=top_k
+            input_top_k=top_k,
+            messages=history
         ))
     
     st.session_state.messages.append({"role": "assistant", "content": answer})
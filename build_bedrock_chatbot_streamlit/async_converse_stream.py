@@ -0,0 +1,152 @@
+"""
+Asyncio backend for ConverseStream.
+
+boto3 has no native asyncio support, so each Bedrock stream is read by a worker thread that runs
+the regular stream_conversation generator and hands its text chunks to the event loop. Coroutines
+only wait on an asyncio.Queue, so a single event loop can multiplex hundreds of concurrent streams:
+  - The thread pool size bounds how many Bedrock streams are open at once (excess requests queue up).
+  - Each stream has a bounded number of in-flight chunks; a slow consumer pauses its reader thread
+    (backpressure) instead of buffering the whole answer in memory.
+  - Closing the async generator early stops the reader thread and closes the Bedrock stream.
+
+Usage (asyncio):
+    async for chunk in get_async_backend().astream(bedrock_client=..., question=..., ...):
+        ...
+
+Usage (Streamlit, or any sync caller): get_async_backend().stream(...) returns a regular generator
+whose chunks are produced on a shared background event loop.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from invoke_model_converse_stream_api import stream_conversation
+
+DEFAULT_MAX_CONCURRENT_STREAMS = int(os.environ.get('CHATBOT_MAX_CONCURRENT_STREAMS', 256))
+DEFAULT_MAX_BUFFERED_CHUNKS = 64
+
+_DONE = object()
+
+
+class _StreamError:
+    __slots__ = ('exception',)
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class AsyncStreamBackend:
+    """
+    Runs stream_conversation for many concurrent sessions on one event loop.
+
+    Args:
+        max_concurrent_streams: Maximum number of Bedrock streams read at the same time.
+        max_buffered_chunks: Chunks a reader thread may get ahead of its consumer before pausing.
+        stream_fn: Sync generator function with the stream_conversation signature (useful for stubs).
+    """
+
+    def __init__(self, max_concurrent_streams=DEFAULT_MAX_CONCURRENT_STREAMS,
+                 max_buffered_chunks=DEFAULT_MAX_BUFFERED_CHUNKS, stream_fn=stream_conversation):
+        self.max_buffered_chunks = max_buffered_chunks
+        self.stream_fn = stream_fn
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_streams,
+                                            thread_name_prefix='converse-stream')
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    @staticmethod
+    def _produce(stream_fn, kwargs, loop, queue, credits, stop):
+        """Worker thread: iterate the sync stream and forward chunks to the event loop"""
+        gen = None
+        try:
+            gen = stream_fn(**kwargs)
+            for chunk in gen:
+                # Wait for the consumer to make room, but give up as soon as it goes away
+                while not credits.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        except Exception as e:
+            if not stop.is_set():
+                loop.call_soon_threadsafe(queue.put_nowait, _StreamError(e))
+        finally:
+            if gen is not None:
+                # Runs stream_conversation's finally, which closes response['stream'] (the Bedrock
+                # EventStream and its HTTP connection) when the consumer went away mid-answer
+                gen.close()
+            if not stop.is_set():
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, _DONE)
+                except RuntimeError:
+                    # The event loop was closed while we were streaming
+                    pass
+
+    async def astream(self, **kwargs):
+        """
+        Async generator yielding the same text chunks as stream_conversation.
+
+        Accepts the same keyword arguments as stream_conversation; the conversation history in
+        `messages` is updated the same way once the stream completes.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        credits = threading.Semaphore(self.max_buffered_chunks)
+        stop = threading.Event()
+
+        loop.run_in_executor(self._executor, self._produce,
+                             self.stream_fn, kwargs, loop, queue, credits, stop)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, _StreamError):
+                    raise item.exception
+                credits.release()
+                yield item
+        finally:
+            # Stops the reader thread if the consumer exits early (no-op once the stream is done)
+            stop.set()
+
+    def _get_loop(self):
+        """Start (once) the background event loop used by the sync bridge"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='converse-stream-loop', daemon=True).start()
+        return self._loop
+
+    def stream(self, **kwargs):
+        """Sync generator over astream, for callers like st.write_stream"""
+        loop = self._get_loop()
+        agen = self.astream(**kwargs)
+        try:
+            while True:
+                try:
+                    yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+                except StopAsyncIteration:
+                    break
+        finally:
+            asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_async_backend(**kwargs):
+    """Return the process-wide AsyncStreamBackend (kwargs only apply on first creation)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = AsyncStreamBackend(**kwargs)
+    return _backend
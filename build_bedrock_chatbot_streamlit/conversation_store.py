@@ -0,0 +1,157 @@
+"""
+Per-session conversation history for the Converse API.
+
+Streamlit runs every user session in the same Python process, so history must be keyed
+by session ID instead of living in a shared list. The store bounds both memory and the
+input tokens resent to Bedrock on every turn:
+  - Each history is trimmed to a token budget (sliding window over the oldest turns).
+  - Dropped turns can optionally be folded into a running summary through a hook.
+  - Idle sessions are evicted by TTL, and the least recently used ones beyond max_sessions.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+def estimate_tokens(message):
+    """Rough token estimate for a Converse message (~4 characters per token)"""
+    chars = 0
+    for block in message.get('content', []):
+        if 'text' in block:
+            chars += len(block['text'])
+    return chars // 4 + 1
+
+
+class _Session:
+    __slots__ = ('messages', 'summary', 'last_access', 'lock')
+
+    def __init__(self):
+        self.messages = []
+        self.summary = None
+        self.last_access = time.monotonic()
+        # Guards messages and summary while the window slides
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """
+    Bounded, thread-safe store of Converse message lists keyed by session ID.
+
+    Args:
+        max_history_tokens: Token budget for the history resent to the model on each turn.
+        max_sessions: Maximum number of sessions kept in memory (least recently used are evicted first).
+        idle_ttl_seconds: Sessions idle for longer than this are evicted.
+        summarizer: Optional callable(previous_summary, dropped_messages) -> str, used to keep a
+            running summary of the turns that fall out of the sliding window.
+        token_counter: Callable(message) -> int used to measure the history.
+    """
+
+    def __init__(self, max_history_tokens=8000, max_sessions=1000, idle_ttl_seconds=3600,
+                 summarizer=None, token_counter=estimate_tokens):
+        self.max_history_tokens = max_history_tokens
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.summarizer = summarizer
+        self.token_counter = token_counter
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        """Drop idle sessions, then the least recently used ones over capacity. Caller holds the lock."""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.idle_ttl_seconds and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+    def _get_session(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = _Session()
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = now
+            self._evict(now)
+        return session
+
+    def _trim(self, session):
+        """Slide the window forward until the history fits the token budget. Caller holds session.lock."""
+        messages = session.messages
+        total = sum(self.token_counter(m) for m in messages)
+        dropped = []
+
+        while total > self.max_history_tokens and len(messages) > 1:
+            # Drop a whole turn, so the history still starts with a user message as Converse requires
+            message = messages.pop(0)
+            dropped.append(message)
+            total -= self.token_counter(message)
+            while messages and messages[0]['role'] != 'user':
+                message = messages.pop(0)
+                dropped.append(message)
+                total -= self.token_counter(message)
+
+        if dropped and self.summarizer:
+            session.summary = self.summarizer(session.summary, dropped)
+
+    def get_messages(self, session_id):
+        """
+        Return the live message list for a session, trimmed to the token budget.
+
+        The caller (e.g. stream_conversation) appends the new user and assistant messages to it.
+        """
+        session = self._get_session(session_id)
+        with session.lock:
+            self._trim(session)
+        return session.messages
+
+    @staticmethod
+    def _with_summary(system_prompt, summary):
+        if not summary:
+            return system_prompt
+        return f"{system_prompt}\n\n<conversation_summary>{summary}</conversation_summary>"
+
+    def build_system_prompt(self, session_id, system_prompt):
+        """Append the running summary of older turns (if any) to the system prompt"""
+        session = self._get_session(session_id)
+        with session.lock:
+            return self._with_summary(system_prompt, session.summary)
+
+    def get_context(self, session_id, system_prompt):
+        """
+        Trim the history, then build the system prompt, in one step: the turns dropped by this trim
+        are already in the summary that goes with the returned messages.
+
+        Returns:
+            (messages, system_prompt): the live message list (see get_messages) and the system prompt
+            with the running summary.
+        """
+        session = self._get_session(session_id)
+        with session.lock:
+            self._trim(session)
+            return session.messages, self._with_summary(system_prompt, session.summary)
+
+    def clear(self, session_id):
+        """Forget a session's history"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store(**kwargs):
+    """Return the process-wide ConversationStore (kwargs only apply on first creation)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(**kwargs)
+    return _store
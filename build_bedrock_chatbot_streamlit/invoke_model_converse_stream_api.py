@@ -2,16 +2,28 @@
 @ Credits:
   Some sections of this Streamlit app have been obtained from: https://github.com/aws-samples/genai-quickstart-pocs
 """
-import json
-import os
+import logging
 
+from pricing import get_pricing_registry
+from stream_accumulator import StreamAccumulator
+from stream_metrics import StreamMetrics, get_metrics_registry
 
-def stream_conversation(bedrock_client, question, system_prompt, input_model_id, input_temperature, input_top_k, messages=[], pricing_list='bedrock_pricing.json'):
+logger = logging.getLogger(__name__)
+
+
+def stream_conversation(bedrock_client, question, system_prompt, input_model_id, input_temperature, input_top_k, messages=None, pricing_list='bedrock_pricing.json', min_chunk_chars=24, hooks=None, on_stop=None):
     """
     Sends messages to a model and streams back the response.
     Args:
         messages: A list of messages to send to the model that helps preserve context along with the latest message.
+                  The new user and assistant messages are appended to it once the model's turn ends, so a
+                  failed or abandoned stream leaves it unchanged. Pass the session's history
+                  (see conversation_store.py); if omitted, the model only sees the current question.
         input_model_id: The ID of the model to use for the conversation.
+        min_chunk_chars: Coalesce deltas into chunks of at least this many characters (0 yields every delta),
+                         so the front end is not re-rendered for every few characters.
+        hooks: Optional callables hook(delta, accumulator) run for every delta (see stream_accumulator.py).
+        on_stop: Optional callable(stop_reason) run when the model's turn ends.
         
     Returns:
         Nothing.
@@ -26,100 +38,180 @@ def stream_conversation(bedrock_client, question, system_prompt, input_model_id,
     # Define the system prompts to guide the model's behavior, and set the general direction of the models role.
     system_prompts = [{"text": system_prompt}]
     
+    # Never share a default list across calls: it would mix the history of every session in the process
+    if messages is None:
+        messages = []
+
     # Format the user's message as a dictionary with role and content
-    message = {
+    user_message = {
         "role": "user",
         "content": [{"text": question}]
     }
+
+    # Client-side latency metrics (TTFT, inter-chunk gaps, tokens/s, cost); see stream_metrics.py
+    region = getattr(getattr(bedrock_client, 'meta', None), 'region_name', None)
+    stream_metrics = StreamMetrics(input_model_id, region)
+
+    stream = None
+    try:
+        response = bedrock_client.converse_stream(
+            modelId=input_model_id,
+            # The history only gets the new turn when it completes: a dangling user message would break
+            # the user/assistant alternation Converse requires on the next question
+            messages=messages + [user_message],
+            system=system_prompts,
+            inferenceConfig=inference_config,
+            additionalModelRequestFields=additional_model_fields
+        )
+
+        stream = response.get('stream')
     
-    # Append the formatted user message to the list of messages.
-    messages.append(message)
-
-    response = bedrock_client.converse_stream(
-        modelId=input_model_id,
-        messages=messages,
-        system=system_prompts,
-        inferenceConfig=inference_config,
-        additionalModelRequestFields=additional_model_fields
-    )
-
-    stream = response.get('stream')
-    
-    # Looping through the response from the converse_stream api call
-    if stream:
+        # Looping through the response from the converse_stream api call
+        if stream:
         
-        # create a variable that will be used to store the streaming content so that we can later append it to the messages
-        streaming_text = ""
+            # Accumulate the streaming content (in linear time) so that we can later append it to the messages
+            accumulator = StreamAccumulator(min_chunk_chars=min_chunk_chars, hooks=hooks)
         
-        for event in stream:
+            for event in stream:
 
-            if 'messageStart' in event:
-                print(f"\nRole: {event['messageStart']['role']}")
-                
-            if 'contentBlockDelta' in event:
-                # using a generator object to stream the text to the streamlit front end.
-                yield event['contentBlockDelta']['delta']['text']
+                if 'messageStart' in event:
+                    print(f"\nRole: {event['messageStart']['role']}")
                 
-                # Add the streaming chunks to our place holder
-                streaming_text += event['contentBlockDelta']['delta']['text']
+                if 'contentBlockDelta' in event:
+                    stream_metrics.on_chunk()
 
-            if 'messageStop' in event:
-                print(f"\nStop reason: {event['messageStop']['stopReason']}")
+                    # Add the streaming chunks to our place holder, and
+                    # using a generator object to stream the (coalesced) text to the streamlit front end.
+                    chunk = accumulator.add(event['contentBlockDelta']['delta']['text'])
+                    if chunk:
+                        yield chunk
+
+                if 'messageStop' in event:
+                    chunk = accumulator.flush()
+
+                    print(f"\nStop reason: {event['messageStop']['stopReason']}")
+                    stream_metrics.on_stop(event['messageStop']['stopReason'])
                 
-                # Construct the message for the next conversation turn
-                message = {
-                    "role": "assistant",
-                    "content": [{"text": streaming_text}]
-                }
+                    # Construct the message for the next conversation turn
+                    message = {
+                        "role": "assistant",
+                        "content": [{"text": accumulator.text}]
+                    }
                 
-                messages.append(message)
-
-            if 'metadata' in event:
-                # Print somme information regarging input and output tokesns as well as latency in ms
-                metadata = event['metadata']
-                print('#'*100)
-
-                if 'usage' in metadata:
-                    print("\nToken usage")
-                    print(f"Input tokens: {metadata['usage']['inputTokens']}")
-                    print(f"Output tokens: {metadata['usage']['outputTokens']}")
-
-                    # Fetch pricing info
-                    pricing_dir = os.path.dirname(os.path.abspath(__file__))
-                    pricing_list = os.path.join(pricing_dir, 'bedrock_pricing.json')
-                    
-                    with open(pricing_list,'r', encoding='utf-8') as f:
-                        pricing_file = json.load(f)
-
-                    # Find matching model in pricing file
-                    matching_model = None
-                    for price_model_id in pricing_file.keys():
-                        if input_model_id.startswith(price_model_id):
-                            matching_model = price_model_id
-                            break
-
-                    if matching_model:
-                        # Estimate cost of call
-                        print(f"Model: {input_model_id}, at temperature {input_temperature} and Top-K of {input_top_k}")
-                        print("""
-                              \nImportant: confirm pricing is up-to-date at https://aws.amazon.com/bedrock/pricing/)
-                                and update bedrock_pricing.json accordingly.
-                              """)
-                        print(f"Price per 1,000 input tokens: {pricing_file[matching_model]['input']*1000:.5f}")
-                        print(f"Price per 1,000 output tokens: {pricing_file[matching_model]['output']*1000:.5f}")
-                        cost_input_tokens = float(metadata['usage']['inputTokens']) * pricing_file[matching_model]['input']
-                        cost_output_tokens = float(metadata['usage']['outputTokens']) * pricing_file[matching_model]['output']
-                        total_cost = round(cost_input_tokens + cost_output_tokens,16)
-
-                        # Print estimated cost
-                        print(f"\nTotal tokens in session: {metadata['usage']['totalTokens']}. Estimated cost: ${total_cost:.10f}")
-                    else:
-                        print(f"\nWarning: Model '{input_model_id}' is not included in the pricing file. Please update bedrock_pricing.json with current pricing information.")
-                        print(f"Total tokens in session: {metadata['usage']['totalTokens']}. Cost estimation not available.")
-
-                if 'metrics' in event['metadata']:
-                    print(
-                        f"\nLatency: {metadata['metrics']['latencyMs']} milliseconds\n")
+                    messages.extend([user_message, message])
+                    if on_stop:
+                        on_stop(event['messageStop']['stopReason'])
+
+                    # Send whatever is still buffered before the turn ends
+                    if chunk:
+                        yield chunk
+
+                if 'metadata' in event:
+                    # Print somme information regarging input and output tokesns as well as latency in ms
+                    metadata = event['metadata']
+                    total_cost = None
+                    print('#'*100)
+
+                    if 'usage' in metadata:
+                        print("\nToken usage")
+                        print(f"Input tokens: {metadata['usage']['inputTokens']}")
+                        print(f"Output tokens: {metadata['usage']['outputTokens']}")
+
+                        # Fetch pricing info from the cached registry (file is only re-read when it changes)
+                        pricing_match = get_pricing_registry(pricing_list).lookup(input_model_id)
+                        matching_model = pricing_match[0] if pricing_match else None
+
+                        if matching_model:
+                            # Estimate cost of call
+                            print(f"Model: {input_model_id}, at temperature {input_temperature} and Top-K of {input_top_k}")
+                            print("""
+                                  \nImportant: confirm pricing is up-to-date at https://aws.amazon.com/bedrock/pricing/)
+                                    and update bedrock_pricing.json accordingly.
+                                  """)
+                            model_prices = pricing_match[1]
+                            print(f"Price per 1,000 input tokens: {model_prices['input']*1000:.5f}")
+                            print(f"Price per 1,000 output tokens: {model_prices['output']*1000:.5f}")
+                            cost_input_tokens = float(metadata['usage']['inputTokens']) * model_prices['input']
+                            cost_output_tokens = float(metadata['usage']['outputTokens']) * model_prices['output']
+                            total_cost = round(cost_input_tokens + cost_output_tokens,16)
+
+                            # Print estimated cost
+                            print(f"\nTotal tokens in session: {metadata['usage']['totalTokens']}. Estimated cost: ${total_cost:.10f}")
+                        else:
+                            print(f"\nWarning: Model '{input_model_id}' is not included in the pricing file. Please update bedrock_pricing.json with current pricing information.")
+                            print(f"Total tokens in session: {metadata['usage']['totalTokens']}. Cost estimation not available.")
+
+                    if 'metrics' in event['metadata']:
+                        print(
+                            f"\nLatency: {metadata['metrics']['latencyMs']} milliseconds\n")
+
+                    stream_metrics.on_metadata(metadata, estimated_cost=total_cost)
                 
-                print('\n'.join([str(d) for d in messages]))
-                print('#'*100)
+                    # Dumping the whole history costs O(history) per turn, so only do it when debugging
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug('\n'.join([str(d) for d in messages]))
+                    print('#'*100)
+
+            # In case the stream ended without a messageStop event
+            chunk = accumulator.flush()
+            if chunk:
+                yield chunk
+    except GeneratorExit:
+        # The consumer stopped reading (e.g. the user left the page)
+        stream_metrics.on_end('cancelled')
+        raise
+    except Exception:
+        stream_metrics.on_end('error')
+        raise
+    finally:
+        # An abandoned stream must release its HTTP connection back to the client's pool
+        if stream is not None and hasattr(stream, 'close'):
+            stream.close()
+        # Record every request, including failed and abandoned ones
+        record = get_metrics_registry().record(stream_metrics)
+        print(f"TTFT: {record['ttft_ms']} ms, stream duration: {record['duration_ms']:.0f} ms, "
+              f"tokens/s: {record['tokens_per_second']}, status: {record['status']}")
+
+
+def cached_stream_conversation(response_cache, bedrock_client, question, system_prompt, input_model_id, input_temperature, input_top_k, messages=None, stream_fn=stream_conversation, replay_chunk_chars=64, **kwargs):
+    """
+    Same generator interface as stream_conversation, but served from a ResponseCache when possible.
+
+    Args:
+        response_cache: bedrock_shared.ResponseCache instance.
+        stream_fn: Generator function used on a cache miss (stream_conversation, or the async backend's stream).
+        replay_chunk_chars: Size of the chunks yielded when replaying a cached answer.
+        The rest of the arguments are the same as stream_conversation.
+
+    Returns:
+        Nothing.
+    """
+    if messages is None:
+        messages = []
+
+    lookup = dict(model_id=input_model_id,
+                  system=[{"text": system_prompt}],
+                  messages=messages + [{"role": "user", "content": [{"text": question}]}],
+                  inference_config={"temperature": input_temperature},
+                  additional_model_fields={"top_k": input_top_k})
+
+    cached = response_cache.get(**lookup)
+    if cached is not None:
+        print(f"\nResponse cache hit for model {input_model_id} (no Bedrock call, no token cost)")
+        text = cached['text']
+        messages.append(lookup['messages'][-1])
+        messages.append({"role": "assistant", "content": [{"text": text}]})
+        for i in range(0, len(text), replay_chunk_chars):
+            yield text[i:i + replay_chunk_chars]
+        return
+
+    chunks, stop_reasons = [], []
+    for chunk in stream_fn(bedrock_client=bedrock_client, question=question, system_prompt=system_prompt,
+                           input_model_id=input_model_id, input_temperature=input_temperature,
+                           input_top_k=input_top_k, messages=messages, on_stop=stop_reasons.append, **kwargs):
+        chunks.append(chunk)
+        yield chunk
+
+    # A truncated (max_tokens) or filtered answer is not cached
+    if stop_reasons and stop_reasons[-1] == "end_turn":
+        response_cache.put(response={"text": ''.join(chunks)}, **lookup)
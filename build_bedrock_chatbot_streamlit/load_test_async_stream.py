@@ -0,0 +1,102 @@
+"""
+Load test for the async ConverseStream backend, against a local stub (no AWS calls, no cost).
+
+The stub replays the ConverseStream event format (messageStart, contentBlockDelta, messageStop,
+metadata) with configurable delays, so we can measure client-side time-to-first-token under
+concurrency.
+
+Example:
+    python load_test_async_stream.py --streams 500 --max-concurrent-streams 256
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+from async_converse_stream import AsyncStreamBackend
+
+
+class StubBedrockClient:
+    """Minimal stand-in for a bedrock-runtime client that only implements converse_stream"""
+
+    def __init__(self, first_token_delay, chunk_delay, chunks, chunk_text="lorem "):
+        self.first_token_delay = first_token_delay
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.chunk_text = chunk_text
+
+    def _events(self):
+        yield {'messageStart': {'role': 'assistant'}}
+        time.sleep(self.first_token_delay)
+        for i in range(self.chunks):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield {'contentBlockDelta': {'delta': {'text': self.chunk_text}, 'contentBlockIndex': 0}}
+        yield {'messageStop': {'stopReason': 'end_turn'}}
+        yield {'metadata': {
+            'usage': {'inputTokens': 10, 'outputTokens': self.chunks, 'totalTokens': 10 + self.chunks},
+            'metrics': {'latencyMs': int((self.first_token_delay + self.chunk_delay * self.chunks) * 1000)},
+        }}
+
+    def converse_stream(self, **kwargs):
+        return {'stream': self._events()}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def run_one(backend, client, results):
+    start = time.perf_counter()
+    first_token = None
+    chunks = 0
+    async for _ in backend.astream(bedrock_client=client,
+                                   question="Hola",
+                                   system_prompt="Eres un asistente virtual amigable",
+                                   input_model_id="anthropic.claude-3-5-haiku-20241022-v1:0",
+                                   input_temperature=0.5,
+                                   input_top_k=150,
+                                   messages=[]):
+        if first_token is None:
+            first_token = time.perf_counter() - start
+        chunks += 1
+    results.append((first_token, time.perf_counter() - start, chunks))
+
+
+async def main(args):
+    backend = AsyncStreamBackend(max_concurrent_streams=args.max_concurrent_streams)
+    client = StubBedrockClient(args.first_token_delay, args.chunk_delay, args.chunks)
+    results = []
+
+    # stream_conversation prints token usage for every stream; keep the report readable
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(run_one(backend, client, results) for _ in range(args.streams)))
+    elapsed = time.perf_counter() - start
+    backend.shutdown()
+
+    ttft = [r[0] * 1000 for r in results]
+    durations = [r[1] * 1000 for r in results]
+    total_chunks = sum(r[2] for r in results)
+
+    print(f"Streams: {args.streams}, max concurrent: {args.max_concurrent_streams}, chunks/stream: {args.chunks}")
+    print(f"Stub delays: first token {args.first_token_delay*1000:.0f} ms, between chunks {args.chunk_delay*1000:.0f} ms")
+    print(f"Wall time: {elapsed:.2f} s, streams/s: {args.streams/elapsed:.1f}, chunks/s: {total_chunks/elapsed:.1f}")
+    print(f"TTFT ms      p50={percentile(ttft, 50):.1f} p95={percentile(ttft, 95):.1f} "
+          f"p99={percentile(ttft, 99):.1f} mean={statistics.mean(ttft):.1f}")
+    print(f"Duration ms  p50={percentile(durations, 50):.1f} p95={percentile(durations, 95):.1f} "
+          f"p99={percentile(durations, 99):.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent time-to-first-token load test with a stub ConverseStream")
+    parser.add_argument("--streams", type=int, default=200, help="Total number of streams to run")
+    parser.add_argument("--max-concurrent-streams", type=int, default=256, help="Reader thread pool size")
+    parser.add_argument("--chunks", type=int, default=50, help="Text chunks per stream")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="Seconds before the first chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="Seconds between chunks")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,142 @@
+"""
+Pricing registry for Bedrock models.
+
+Loads bedrock_pricing.json once per process, keeps it cached and only re-reads
+the file when its modification time changes. Model IDs are resolved by longest
+prefix over a sorted index (bisect), so a lookup does not scan every key.
+"""
+import bisect
+import json
+import os
+import threading
+
+DEFAULT_PRICING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bedrock_pricing.json')
+
+# Cross-region inference profiles prepend a geography to the model ID; e.g. "us.anthropic.claude-3-5-haiku-..."
+CROSS_REGION_PREFIXES = ('us.', 'eu.', 'apac.', 'jp.', 'au.', 'ca.', 'us-gov.', 'global.')
+
+
+def _common_prefix(a, b):
+    """Return the common leading substring of a and b"""
+    i = 0
+    limit = min(len(a), len(b))
+    while i < limit and a[i] == b[i]:
+        i += 1
+    return a[:i]
+
+
+class PricingRegistry:
+    """
+    In-memory, auto-reloading view over a pricing JSON file.
+
+    The file maps model ID prefixes to a dict with 'input' and 'output' prices per token.
+    """
+
+    def __init__(self, pricing_file=DEFAULT_PRICING_FILE):
+        self.pricing_file = pricing_file
+        self._lock = threading.Lock()
+        self._mtime = None
+        # (prices dict, sorted list of its keys), swapped as a single reference on reload
+        self._index = ({}, [])
+
+    def _reload_if_changed(self):
+        """Re-read the pricing file only if its mtime changed since the last load"""
+        try:
+            mtime = os.stat(self.pricing_file).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            # Another thread may have reloaded while we were waiting for the lock
+            if mtime == self._mtime:
+                return
+
+            prices = {}
+            if mtime is not None:
+                with open(self.pricing_file, 'r', encoding='utf-8') as f:
+                    prices = json.load(f)
+
+            self._index = (prices, sorted(prices))
+            self._mtime = mtime
+
+    @staticmethod
+    def _longest_prefix(keys, model_id):
+        """
+        Find the longest key in the index that is a prefix of model_id.
+
+        Every key that is a prefix of model_id sorts at or before it, so we only check the
+        closest key to the left of the insertion point. If that one is not a prefix, any
+        matching key must also be a prefix of their common prefix, so we search again with it.
+        """
+        query = model_id
+        while query:
+            idx = bisect.bisect_right(keys, query)
+            if idx == 0:
+                return None
+            candidate = keys[idx - 1]
+            if query.startswith(candidate):
+                return candidate
+            query = _common_prefix(query, candidate)
+        return None
+
+    def lookup(self, model_id):
+        """
+        Resolve the pricing entry for a model ID.
+
+        Args:
+            model_id: Bedrock model ID or cross-region inference profile ID.
+
+        Returns:
+            Tuple of (matching pricing key, {'input': ..., 'output': ...}), or None if not found.
+        """
+        if not model_id:
+            return None
+
+        self._reload_if_changed()
+
+        prices, keys = self._index
+
+        matching_model = self._longest_prefix(keys, model_id)
+        if matching_model is None and model_id.startswith(CROSS_REGION_PREFIXES):
+            matching_model = self._longest_prefix(keys, model_id.split('.', 1)[1])
+
+        if matching_model is None or matching_model not in prices:
+            return None
+        return matching_model, prices[matching_model]
+
+    def estimate_cost(self, model_id, input_tokens, output_tokens):
+        """
+        Estimate the cost of a call in USD.
+
+        Returns:
+            The estimated cost, or None if the model is not in the pricing file.
+        """
+        match = self.lookup(model_id)
+        if match is None:
+            return None
+        _, model_prices = match
+        cost_input_tokens = float(input_tokens) * model_prices['input']
+        cost_output_tokens = float(output_tokens) * model_prices['output']
+        return round(cost_input_tokens + cost_output_tokens, 16)
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_pricing_registry(pricing_file=DEFAULT_PRICING_FILE):
+    """
+    Return the process-wide PricingRegistry for a given pricing file.
+
+    Relative paths are resolved against this module's directory, so the app can be launched from anywhere.
+    """
+    if not os.path.isabs(pricing_file):
+        pricing_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), pricing_file)
+    registry = _registries.get(pricing_file)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(pricing_file, PricingRegistry(pricing_file))
+    return registry
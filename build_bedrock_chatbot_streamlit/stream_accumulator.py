@@ -0,0 +1,83 @@
+"""
+Accumulator for streamed model output.
+
+Appending each delta to a string (`text += delta`) copies the whole answer on every chunk, which
+is quadratic for long outputs. StreamAccumulator keeps the deltas in a list and joins them once.
+
+It can also coalesce tiny deltas into larger chunks so the UI is not re-rendered for every few
+characters, and run incremental hooks (e.g. token counting) as text arrives.
+"""
+import time
+
+
+class StreamAccumulator:
+    """
+    Collects streamed text deltas in linear time.
+
+    Args:
+        min_chunk_chars: Emit coalesced chunks once at least this many characters are pending.
+                         0 disables coalescing (every delta is emitted as-is).
+        max_delay_seconds: When a delta arrives and this much time passed since the last emit, emit the
+                           pending text even if it is shorter than min_chunk_chars. This is only
+                           checked in add(): while the stream stalls, pending text waits for the next
+                           delta (or for the consumer's flush() at the end of the content block).
+        hooks: Callables hook(delta, accumulator), run for every raw delta.
+    """
+
+    def __init__(self, min_chunk_chars=0, max_delay_seconds=0.05, hooks=None):
+        self.min_chunk_chars = min_chunk_chars
+        self.max_delay_seconds = max_delay_seconds
+        self.hooks = list(hooks or [])
+        self._parts = []
+        self._pending = []
+        self._pending_chars = 0
+        self._last_emit = None
+        self._text = None
+        self.chars = 0
+        self.estimated_tokens = 0
+
+    def add(self, delta):
+        """
+        Add a delta and return the text to emit now (a coalesced chunk), or None to keep buffering.
+
+        The first chunk is always emitted immediately so time-to-first-token is not delayed.
+        """
+        self._parts.append(delta)
+        self._text = None
+        self.chars += len(delta)
+        # ~4 characters per token; cheap running estimate for UIs and budgets
+        self.estimated_tokens = self.chars // 4
+
+        for hook in self.hooks:
+            hook(delta, self)
+
+        if self.min_chunk_chars <= 0:
+            return delta
+
+        self._pending.append(delta)
+        self._pending_chars += len(delta)
+        now = time.monotonic()
+        if (self._last_emit is None
+                or self._pending_chars >= self.min_chunk_chars
+                or now - self._last_emit >= self.max_delay_seconds):
+            self._last_emit = now
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Return any pending (not yet emitted) text, or None if there is nothing pending"""
+        if not self._pending:
+            return None
+        chunk = ''.join(self._pending)
+        self._pending = []
+        self._pending_chars = 0
+        return chunk
+
+    @property
+    def text(self):
+        """Full accumulated text (joined once, then cached until the next delta)"""
+        if self._text is None:
+            self._text = ''.join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
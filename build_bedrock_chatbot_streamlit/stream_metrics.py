@@ -0,0 +1,360 @@
+"""
+Client-side latency metrics for streamed chats.
+
+For every streamed request we record time-to-first-token (TTFT), the gaps between chunks,
+total stream duration, output tokens per second, token usage, estimated cost, stop reason and
+status ('ok', or 'error' / 'cancelled' for streams that failed or were abandoned).
+
+- Each request is appended as one JSON line to a rotating local log (logs/stream_metrics.jsonl).
+- Aggregates per model are kept in memory and can be exported as Prometheus text
+  (MetricsRegistry.to_prometheus) or as OTLP-compatible JSON (MetricsRegistry.to_otlp_json):
+    - CHATBOT_PROMETHEUS_PORT=9464 serves them at http://<host>:9464/metrics.
+    - CHATBOT_OTLP_ENDPOINT=http://collector:4318/v1/metrics pushes them every
+      CHATBOT_OTLP_INTERVAL_SECONDS (default 60).
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+METRICS_LOG_FILE = os.environ.get(
+    'CHATBOT_METRICS_LOG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'stream_metrics.jsonl'))
+METRICS_LOG_MAX_BYTES = 10 * 1024 * 1024
+METRICS_LOG_BACKUP_COUNT = 5
+
+# Histogram bucket upper bounds, in milliseconds
+TTFT_BUCKETS_MS = (100, 250, 500, 1000, 2000, 5000, 10000)
+GAP_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000)
+DURATION_BUCKETS_MS = (500, 1000, 2500, 5000, 10000, 30000, 60000, 120000)
+
+PROMETHEUS_PORT = os.environ.get('CHATBOT_PROMETHEUS_PORT')
+OTLP_ENDPOINT = os.environ.get('CHATBOT_OTLP_ENDPOINT')
+OTLP_INTERVAL_SECONDS = float(os.environ.get('CHATBOT_OTLP_INTERVAL_SECONDS', 60))
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-friendly histogram with fixed bucket bounds (last bucket is +Inf)"""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.sum += other.sum
+        self.count += other.count
+
+    def to_dict(self):
+        return {'bounds': list(self.bounds), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class StreamMetrics:
+    """
+    Recorder for a single streamed request. Call the on_* hooks while iterating the stream,
+    then finish() to get the record.
+    """
+
+    def __init__(self, model_id, region=None):
+        self.model_id = model_id
+        self.region = region
+        self.start = time.perf_counter()
+        self.first_chunk_at = None
+        self.last_chunk_at = None
+        self.chunks = 0
+        self.gaps = Histogram(GAP_BUCKETS_MS)
+        self.stop_reason = None
+        self.input_tokens = None
+        self.output_tokens = None
+        self.server_latency_ms = None
+        self.estimated_cost = None
+        self.status = 'ok'
+
+    def on_chunk(self):
+        now = time.perf_counter()
+        if self.first_chunk_at is None:
+            self.first_chunk_at = now
+        else:
+            self.gaps.observe((now - self.last_chunk_at) * 1000)
+        self.last_chunk_at = now
+        self.chunks += 1
+
+    def on_stop(self, stop_reason):
+        self.stop_reason = stop_reason
+
+    def on_metadata(self, metadata, estimated_cost=None):
+        usage = metadata.get('usage', {})
+        self.input_tokens = usage.get('inputTokens')
+        self.output_tokens = usage.get('outputTokens')
+        self.server_latency_ms = metadata.get('metrics', {}).get('latencyMs')
+        self.estimated_cost = estimated_cost
+
+    def on_end(self, status):
+        """'ok', 'error' (the request or the stream failed) or 'cancelled' (the consumer went away)"""
+        self.status = status
+
+    def finish(self):
+        """Return the request record as a JSON-serializable dict"""
+        end = time.perf_counter()
+        ttft_ms = (self.first_chunk_at - self.start) * 1000 if self.first_chunk_at is not None else None
+
+        # Generation rate, measured from the first chunk so it is not skewed by queueing/prompt processing
+        tokens_per_second = None
+        if self.output_tokens and self.first_chunk_at is not None and self.last_chunk_at > self.first_chunk_at:
+            tokens_per_second = self.output_tokens / (self.last_chunk_at - self.first_chunk_at)
+
+        return {
+            'timestamp': time.time(),
+            'model_id': self.model_id,
+            'region': self.region,
+            'ttft_ms': ttft_ms,
+            'duration_ms': (end - self.start) * 1000,
+            'chunks': self.chunks,
+            'inter_chunk_gap_ms': self.gaps.to_dict(),
+            'tokens_per_second': tokens_per_second,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'server_latency_ms': self.server_latency_ms,
+            'estimated_cost': self.estimated_cost,
+            'stop_reason': self.stop_reason,
+            'status': self.status,
+        }
+
+
+class _ModelAggregate:
+    def __init__(self):
+        self.requests = 0
+        self.ttft = Histogram(TTFT_BUCKETS_MS)
+        self.gaps = Histogram(GAP_BUCKETS_MS)
+        self.duration = Histogram(DURATION_BUCKETS_MS)
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.estimated_cost = 0.0
+        self.stop_reasons = {}
+        self.statuses = {}
+
+
+class MetricsRegistry:
+    """Process-wide aggregation of StreamMetrics records, plus the rotating JSON-lines log"""
+
+    def __init__(self, log_file=METRICS_LOG_FILE):
+        self._lock = threading.Lock()
+        self._by_model = {}
+        self._start_ns = str(time.time_ns())
+        self._logger = None
+        if log_file:
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            handler = RotatingFileHandler(log_file, maxBytes=METRICS_LOG_MAX_BYTES,
+                                          backupCount=METRICS_LOG_BACKUP_COUNT, encoding='utf-8')
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._logger = logging.getLogger(f"{__name__}.{log_file}")
+            self._logger.setLevel(logging.INFO)
+            self._logger.propagate = False
+            if not self._logger.handlers:
+                self._logger.addHandler(handler)
+
+    def record(self, stream_metrics):
+        """
+        Finish a StreamMetrics recorder and add it to the aggregates and the log.
+
+        Returns:
+            The request record (see StreamMetrics.finish).
+        """
+        record = stream_metrics.finish()
+        with self._lock:
+            agg = self._by_model.setdefault((record['model_id'], record['region']), _ModelAggregate())
+            agg.requests += 1
+            if record['ttft_ms'] is not None:
+                agg.ttft.observe(record['ttft_ms'])
+            agg.duration.observe(record['duration_ms'])
+            agg.gaps.merge(stream_metrics.gaps)
+            agg.input_tokens += record['input_tokens'] or 0
+            agg.output_tokens += record['output_tokens'] or 0
+            agg.estimated_cost += record['estimated_cost'] or 0.0
+            reason = record['stop_reason'] or 'unknown'
+            agg.stop_reasons[reason] = agg.stop_reasons.get(reason, 0) + 1
+            agg.statuses[record['status']] = agg.statuses.get(record['status'], 0) + 1
+
+        if self._logger:
+            self._logger.info(json.dumps(record))
+        return record
+
+    def to_prometheus(self):
+        """Export the aggregates in the Prometheus text exposition format"""
+        lines = []
+
+        def labels(model_id, region, **extra):
+            pairs = {'model_id': model_id, 'region': region or '', **extra}
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs.items()) + '}'
+
+        def histogram(name, help_text, attr):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for (model_id, region), agg in self._by_model.items():
+                hist = getattr(agg, attr)
+                cumulative = 0
+                for bound, count in zip(list(hist.bounds) + ['+Inf'], hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{labels(model_id, region, le=bound)} {cumulative}")
+                lines.append(f"{name}_sum{labels(model_id, region)} {hist.sum}")
+                lines.append(f"{name}_count{labels(model_id, region)} {hist.count}")
+
+        def counter(name, help_text, value_fn):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (model_id, region), agg in self._by_model.items():
+                lines.append(f"{name}{labels(model_id, region)} {value_fn(agg)}")
+
+        with self._lock:
+            histogram('chat_stream_ttft_ms', 'Client-side time to first token in milliseconds', 'ttft')
+            histogram('chat_stream_inter_chunk_gap_ms', 'Gap between streamed chunks in milliseconds', 'gaps')
+            histogram('chat_stream_duration_ms', 'Total stream duration in milliseconds', 'duration')
+            counter('chat_stream_requests_total', 'Streamed requests', lambda agg: agg.requests)
+            counter('chat_stream_input_tokens_total', 'Input tokens', lambda agg: agg.input_tokens)
+            counter('chat_stream_output_tokens_total', 'Output tokens', lambda agg: agg.output_tokens)
+            counter('chat_stream_estimated_cost_usd_total', 'Estimated cost in USD', lambda agg: agg.estimated_cost)
+            lines.append("# HELP chat_stream_stop_reason_total Streamed requests by stop reason")
+            lines.append("# TYPE chat_stream_stop_reason_total counter")
+            for (model_id, region), agg in self._by_model.items():
+                for reason, count in agg.stop_reasons.items():
+                    lines.append(f"chat_stream_stop_reason_total{labels(model_id, region, stop_reason=reason)} {count}")
+            lines.append("# HELP chat_stream_status_total Streamed requests by status (ok, error, cancelled)")
+            lines.append("# TYPE chat_stream_status_total counter")
+            for (model_id, region), agg in self._by_model.items():
+                for status, count in agg.statuses.items():
+                    lines.append(f"chat_stream_status_total{labels(model_id, region, status=status)} {count}")
+
+        return '\n'.join(lines) + '\n'
+
+    def to_otlp_json(self):
+        """Export the aggregates as an OTLP/JSON ExportMetricsServiceRequest payload"""
+        now_ns = str(time.time_ns())
+
+        def attributes(model_id, region, **extra):
+            pairs = {'model_id': model_id, 'region': region or '', **extra}
+            return [{'key': key, 'value': {'stringValue': value}} for key, value in pairs.items()]
+
+        def histogram(name, unit, attr):
+            points = []
+            for (model_id, region), agg in self._by_model.items():
+                hist = getattr(agg, attr)
+                points.append({'attributes': attributes(model_id, region), 'startTimeUnixNano': self._start_ns,
+                               'timeUnixNano': now_ns, 'count': str(hist.count), 'sum': hist.sum,
+                               'bucketCounts': [str(c) for c in hist.counts],
+                               'explicitBounds': list(hist.bounds)})
+            # aggregationTemporality 2 = CUMULATIVE
+            return {'name': name, 'unit': unit,
+                    'histogram': {'dataPoints': points, 'aggregationTemporality': 2}}
+
+        def counter(name, unit, value_fn, as_double=False):
+            points = []
+            for (model_id, region), agg in self._by_model.items():
+                value = value_fn(agg)
+                point = {'attributes': attributes(model_id, region), 'startTimeUnixNano': self._start_ns,
+                         'timeUnixNano': now_ns}
+                point['asDouble' if as_double else 'asInt'] = value if as_double else str(value)
+                points.append(point)
+            return {'name': name, 'unit': unit,
+                    'sum': {'dataPoints': points, 'aggregationTemporality': 2, 'isMonotonic': True}}
+
+        with self._lock:
+            metrics = [
+                histogram('chat.stream.ttft', 'ms', 'ttft'),
+                histogram('chat.stream.inter_chunk_gap', 'ms', 'gaps'),
+                histogram('chat.stream.duration', 'ms', 'duration'),
+                counter('chat.stream.requests', '1', lambda agg: agg.requests),
+                counter('chat.stream.input_tokens', '{token}', lambda agg: agg.input_tokens),
+                counter('chat.stream.output_tokens', '{token}', lambda agg: agg.output_tokens),
+                counter('chat.stream.estimated_cost', 'USD', lambda agg: agg.estimated_cost, as_double=True),
+            ]
+            statuses = [{'attributes': attributes(model_id, region, status=status), 'startTimeUnixNano': self._start_ns,
+                         'timeUnixNano': now_ns, 'asInt': str(count)}
+                        for (model_id, region), agg in self._by_model.items()
+                        for status, count in agg.statuses.items()]
+            metrics.append({'name': 'chat.stream.status', 'unit': '1',
+                            'sum': {'dataPoints': statuses, 'aggregationTemporality': 2, 'isMonotonic': True}})
+
+        return {'resourceMetrics': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'bedrock-chatbot'}}]},
+            'scopeMetrics': [{'scope': {'name': __name__}, 'metrics': metrics}],
+        }]}
+
+
+def serve_prometheus(registry, port, host='0.0.0.0'):
+    """Serve registry.to_prometheus() at /metrics from a daemon thread"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='prometheus-metrics', daemon=True).start()
+    logger.info(f"Stream metrics served at http://{host}:{port}/metrics")
+    return server
+
+
+def push_otlp(registry, endpoint, interval_seconds):
+    """POST registry.to_otlp_json() to an OTLP/HTTP collector every interval_seconds, from a daemon thread"""
+
+    def loop():
+        while True:
+            time.sleep(interval_seconds)
+            request = urllib.request.Request(endpoint, data=json.dumps(registry.to_otlp_json()).encode('utf-8'),
+                                             headers={'Content-Type': 'application/json'}, method='POST')
+            try:
+                with urllib.request.urlopen(request, timeout=10):
+                    pass
+            except Exception as e:
+                logger.warning(f"OTLP metrics push to {endpoint} failed: {e}")
+
+    threading.Thread(target=loop, name='otlp-metrics', daemon=True).start()
+    logger.info(f"Stream metrics pushed to {endpoint} every {interval_seconds:.0f} s")
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry():
+    """Return the process-wide MetricsRegistry; the exporters enabled by environment variables start with it"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = MetricsRegistry()
+                if PROMETHEUS_PORT:
+                    try:
+                        serve_prometheus(registry, int(PROMETHEUS_PORT))
+                    except OSError as e:
+                        # e.g. another app process already serves the port
+                        logger.warning(f"Prometheus metrics endpoint not started on port {PROMETHEUS_PORT}: {e}")
+                if OTLP_ENDPOINT:
+                    push_otlp(registry, OTLP_ENDPOINT, OTLP_INTERVAL_SECONDS)
+                _registry = registry
+    return _registry
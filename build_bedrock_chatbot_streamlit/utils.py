@@ -1,48 +1,180 @@
 import streamlit as st
-import boto3
+import json
+import os
 import re
+import sys
+import threading
+import time
+from collections import OrderedDict
 from boto3.session import Session
 
+# Make the repository-level bedrock_shared package importable when running `streamlit run app.py` from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared import get_client
+
+# Control-plane lookups (regions, model listings) change rarely, but Streamlit reruns the script on
+# every widget interaction. They are cached once per process (shared by all sessions) and persisted
+# to disk so a fresh worker starts warm.
+CONTROL_PLANE_CACHE_TTL_SECONDS = 15 * 60
+CONTROL_PLANE_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'bedrock_control_plane.json')
+
+
+class TTLCache:
+    """
+    Thread-safe, stale-while-revalidate cache with an optional JSON file for warm starts.
+
+    - A missing key is loaded synchronously.
+    - An expired key returns the stale value immediately and is refreshed in a background thread.
+    - If a background refresh fails, the stale value is kept and retried on the next expiry.
+    """
+
+    def __init__(self, ttl_seconds, cache_file=None):
+        self.ttl_seconds = ttl_seconds
+        self.cache_file = cache_file
+        self._entries = {}  # json key -> (value, expires_at in epoch seconds)
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._load_from_disk()
+
+    def _load_from_disk(self):
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                for key, entry in json.load(f).items():
+                    self._entries[key] = (entry['value'], entry['expires_at'])
+        except (OSError, ValueError, KeyError, TypeError):
+            # A corrupt cache file is not fatal; it will be rewritten on the next load
+            self._entries = {}
+
+    def _save_to_disk(self):
+        if not self.cache_file:
+            return
+        with self._lock:
+            snapshot = {key: {'value': value, 'expires_at': expires_at}
+                        for key, (value, expires_at) in self._entries.items()}
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_file = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError:
+            pass
+
+    def _store(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl_seconds)
+        self._save_to_disk()
+
+    def _refresh(self, key, loader):
+        try:
+            self._store(key, loader())
+        except Exception:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key_parts, loader):
+        """
+        Return the cached value for key_parts, calling loader() to fill or refresh it.
+
+        Args:
+            key_parts: JSON-serializable tuple identifying the lookup; e.g. (region, provider, filters).
+            loader: Zero-argument callable returning a JSON-serializable value.
+        """
+        key = json.dumps(key_parts, sort_keys=True)
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            value = loader()
+            self._store(key, value)
+            return value
+
+        value, expires_at = entry
+        if time.time() >= expires_at:
+            with self._lock:
+                start_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if start_refresh:
+                threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self._save_to_disk()
+
+
+_control_plane_cache = TTLCache(CONTROL_PLANE_CACHE_TTL_SECONDS, CONTROL_PLANE_CACHE_FILE)
+
 
 def get_available_regions():
     """Get available AWS regions for Bedrock"""
-    s = Session()
-    return s.get_available_regions('bedrock')
+    return _control_plane_cache.get(('regions', 'bedrock'), lambda: Session().get_available_regions('bedrock'))
+
 
+def _list_foundation_models(region, params):
+    bedrock = get_client('bedrock', region_name=region)
+    return bedrock.list_foundation_models(**params)['modelSummaries']
 
-def get_model_summaries(region, provider=None):
-    """Get model summaries filtered by provider"""
-    bedrock = boto3.client('bedrock', region_name=region)
-    
+
+def get_model_summaries(region, provider=None, inference_type='ON_DEMAND', output_modality='TEXT'):
+    """Get model summaries filtered by provider (cached per region, provider and filters)"""
     params = {
-        'byInferenceType': 'ON_DEMAND',
-        'byOutputModality': 'TEXT'
+        'byInferenceType': inference_type,
+        'byOutputModality': output_modality
     }
-    
+
     if provider:
         params['byProvider'] = provider
-        
+
     try:
-        response = bedrock.list_foundation_models(**params)
-        return response['modelSummaries']
+        return _control_plane_cache.get(('model_summaries', region, params),
+                                        lambda: _list_foundation_models(region, params))
     except Exception as e:
         st.error(f"Error fetching models: {str(e)}")
         return []
 
 
+# Results derived from a cached listing, keyed by (function name, id of the listing).
+# The listing itself is kept in the value so its id cannot be reused while the entry exists.
+_DERIVED_CACHE_SIZE = 64
+_derived_cache = OrderedDict()
+_derived_cache_lock = threading.Lock()
+
+
+def _derived(name, model_summaries, compute):
+    key = (name, id(model_summaries))
+    with _derived_cache_lock:
+        entry = _derived_cache.get(key)
+        if entry is not None and entry[0] is model_summaries:
+            _derived_cache.move_to_end(key)
+            return entry[1]
+
+    result = compute(model_summaries)
+    with _derived_cache_lock:
+        _derived_cache[key] = (model_summaries, result)
+        while len(_derived_cache) > _DERIVED_CACHE_SIZE:
+            _derived_cache.popitem(last=False)
+    return result
+
+
 def get_unique_providers(model_summaries):
     """Extract unique provider names from model summaries"""
-    return sorted(list(set(model['providerName'] for model in model_summaries)))
+    return list(_derived('providers', model_summaries,
+                         lambda summaries: sorted(set(model['providerName'] for model in summaries))))
 
 
 def filter_models(model_summaries):
     """Filter models based on status and modelId format"""
     # Pattern matches ':' followed by any numbers followed by 'k'
     context_window_pattern = re.compile(r':\d+k$')
-    
-    return [
-        model for model in model_summaries
+
+    return list(_derived('active_models', model_summaries, lambda summaries: [
+        model for model in summaries
         if (model['modelLifecycle']['status'] == 'ACTIVE' and
             not context_window_pattern.search(model['modelId']))
-    ]
-
+    ]))
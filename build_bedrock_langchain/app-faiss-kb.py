@@ -1,16 +1,20 @@
 # Credits: github.com/somilg050/rag-aws-bedrock/tree/master
 import os
-import boto3
+import sys
 import streamlit as st
-import shutil
 import logging
-from langchain_aws import BedrockEmbeddings
-from langchain_community.vectorstores.faiss import FAISS
 from langchain.agents import create_agent
 from langchain.tools import tool
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders.pdf import PyPDFDirectoryLoader
 from langchain_aws import ChatBedrock
+from langchain_core.messages import AIMessageChunk, ToolMessage
+
+# Make the repository-level bedrock_shared package importable when running from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared import get_bedrock_runtime_client, get_embedding_engine, get_response_cache
+from langchain_embeddings import EngineEmbeddings
+from retriever_service import get_retriever_service, get_shared_resource
+from ingestion import ingest_directory
+from context_assembler import assemble_context
 
 # Configure logging
 logging.basicConfig(
@@ -20,49 +24,37 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Load the Titan Embeddings using Bedrock client.
+# The engine batches, dedupes and rate-limits calls, and caches vectors on disk by content hash.
 logger.info("Initializing Bedrock client and Titan embeddings...")
-bedrock = boto3.client(service_name='bedrock-runtime')
-titan_embeddings = BedrockEmbeddings(model_id="amazon.titan-embed-text-v2:0",
-                                     client=bedrock)
+bedrock = get_bedrock_runtime_client()
+titan_embeddings = EngineEmbeddings(get_embedding_engine(
+    model_id="amazon.titan-embed-text-v2:0",
+    cache_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite")))
 logger.info("Bedrock client and embeddings initialized successfully")
 
-# Load the PDFs from the directory
-def data_ingestion():
-    logger.info("Starting data ingestion from PDF directory...")
-    loader = PyPDFDirectoryLoader("data_pdf_electronics")
-    documents = loader.load()
-    logger.info(f"Loaded {len(documents)} documents from PDFs")
-    
-    # Split the text into chunks
-    logger.info("Splitting documents into chunks (chunk_size=1000, overlap=250)...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000,
-                                                   chunk_overlap=250)
-    docs = text_splitter.split_documents(documents)
-    logger.info(f"Created {len(docs)} text chunks from documents")
-    return docs
-
-
-# Vector Store for Vector Embeddings
-def setup_vector_store(documents):
-    logger.info(f"Creating FAISS vector store from {len(documents)} documents...")
-    # Create a vector store using FAISS from the documents and the embeddings
-    vector_store = FAISS.from_documents(
-        documents,
-        titan_embeddings,
-    )
-    logger.info("Vector store created successfully")
-    
-    # Save the vector store locally
-    # - See: python.langchain.com/docs/integrations/vectorstores/faiss
-    logger.info("Saving vector store to 'faiss_index_electronics'...")
-    vector_store.save_local("faiss_index_electronics")
-    logger.info("Vector store saved successfully")
-
+LLM_MODEL_ID = "global.anthropic.claude-sonnet-4-5-20250929-v1:0"
+INDEX_PATH = "faiss_index_electronics"
+PDF_DIR = "data_pdf_electronics"
+# Search backend: auto (exact NumPy search for small corpora, IVF for large ones), numpy, ivf or faiss.
+# Compare them on your corpus with benchmark_retrievers.py.
+RETRIEVER_BACKEND = os.environ.get("RAG_RETRIEVER_BACKEND", "auto")
+# Diversify retrieved chunks with MMR, so near-duplicates are not all sent to the LLM (RAG_MMR=0 disables it)
+RETRIEVAL_MMR = os.environ.get("RAG_MMR", "1") == "1"
+# Stream the agent's progress and answer tokens instead of waiting for the whole agent loop (RAG_STREAMING=0 disables it)
+STREAMING = os.environ.get("RAG_STREAMING", "1") == "1"
+# Token budget for the retrieved context sent to the LLM on each tool call
+CONTEXT_MAX_TOKENS = int(os.environ.get("RAG_CONTEXT_MAX_TOKENS", 2000))
+
+# Cache of final answers: repeated (or very similar, by Titan embedding) FAQ questions skip the agent and the LLM.
+# It is cleared whenever the vector store changes, since answers depend on the knowledge base.
+response_cache = get_response_cache(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "responses.sqlite"),
+                                    embed_fn=titan_embeddings.embed_query,
+                                    similarity_threshold=0.95)
 
 # Load the LLM from the Bedrock
 def load_llm():
     logger.info("Loading ChatBedrock LLM (Claude Sonnet 4.5)...")
-    llm = ChatBedrock(model_id="global.anthropic.claude-sonnet-4-5-20250929-v1:0", client=bedrock, model_kwargs={"max_tokens": 512})
+    llm = ChatBedrock(model_id=LLM_MODEL_ID, client=bedrock, model_kwargs={"max_tokens": 512})
     logger.info("LLM loaded successfully")
     return llm
 
@@ -72,32 +64,33 @@ system_prompt = """Use the following pieces of context to answer the question at
 1. If the answer is not within the context knowledge, kindly state that you do not know, rather than attempting to fabricate a response.
 2. If you find the answer, please craft a detailed and concise response to the question at the end. Aim for a summary of max 250 words, ensuring that your explanation is thorough.
 
-You have access to a retrieval tool that can search the knowledge base. Use it to find relevant information before answering."""
+You have access to a retrieval tool that can search the knowledge base. Use it to find relevant information before answering.
+If you need several searches (e.g. one per sub-question or rephrasing), pass all the queries in a single call."""
 
 
-# Create a retrieval tool for the agent
-def create_retrieval_tool(vector_store):
+# Create a retrieval tool for the agent.
+# vector_store is anything with multi_query_search(queries, k, use_mmr), e.g. the RetrieverService,
+# which always searches the latest index version with the configured backend.
+def create_retrieval_tool(vector_store, k=3, use_mmr=RETRIEVAL_MMR, max_context_tokens=CONTEXT_MAX_TOKENS):
     @tool(response_format="content_and_artifact")
-    def retrieve_context(query: str):
-        """Retrieve information from the QLED TV knowledge base."""
-        logger.info(f"Retrieval tool called with query: '{query}'")
-        retrieved_docs = vector_store.similarity_search(query, k=3)
+    def retrieve_context(queries: list[str]):
+        """Retrieve information from the QLED TV knowledge base. Pass every search query you need in one call."""
+        logger.info(f"Retrieval tool called with queries: {queries}")
+        # One embedding batch and one search for all queries; overlapping chunks are returned once
+        retrieved_docs = vector_store.multi_query_search(queries, k=k, use_mmr=use_mmr)
         logger.info(f"Retrieved {len(retrieved_docs)} documents from vector store")
         
-        serialized = "\n\n".join(
-            f"Source: {doc.metadata}\nContent: {doc.page_content}"
-            for doc in retrieved_docs
-        )
-        logger.debug(f"Serialized context length: {len(serialized)} characters")
+        # Overlapping chunks of the same page are merged and the context is kept within the token budget
+        serialized, stats = assemble_context(retrieved_docs, max_tokens=max_context_tokens)
+        logger.info(f"Context: {stats['passages']} passages, ~{stats['tokens_after']} tokens "
+                    f"(~{stats['tokens_saved']} saved, {stats['truncated']} truncated, {stats['dropped']} dropped)")
         return serialized, retrieved_docs
     
     return retrieve_context
 
 
-# Create an agent and get response
-def get_response(llm, vector_store, query):
-    logger.info(f"Processing query: '{query}'")
-    
+# Create the agent once; it is reused for every query (see get_shared_resource)
+def create_rag_agent(llm, vector_store):
     # Create the retrieval tool
     logger.info("Creating retrieval tool for agent...")
     retrieval_tool = create_retrieval_tool(vector_store)
@@ -110,6 +103,12 @@ def get_response(llm, vector_store, query):
         system_prompt=system_prompt
     )
     logger.info("Agent created successfully")
+    return agent
+
+
+# Get a response from the agent
+def get_response(agent, query):
+    logger.info(f"Processing query: '{query}'")
     
     # Invoke the agent
     logger.info("Invoking agent to process query...")
@@ -122,8 +121,46 @@ def get_response(llm, vector_store, query):
     return final_answer
 
 
+# Stream a response from the agent: tool-call progress lines and the answer tokens, as they are generated.
+# on_complete(final_answer) is called at the end with the answer text only (without the progress lines).
+def stream_response(agent, query, on_complete=None):
+    logger.info(f"Processing query (streaming): '{query}'")
+    answer_parts = []
+    
+    # "messages" yields LLM tokens as they arrive; "updates" yields each finished step (tool calls, tool results)
+    for mode, data in agent.stream({"messages": [{"role": "user", "content": query}]},
+                                   stream_mode=["messages", "updates"]):
+        if mode == "messages":
+            chunk, metadata = data
+            if metadata.get("langgraph_node") in ("model", "agent") and isinstance(chunk, AIMessageChunk):
+                text = chunk.text
+                if text:
+                    answer_parts.append(text)
+                    yield text
+        else:
+            for update in data.values():
+                for message in (update or {}).get("messages", []):
+                    tool_calls = getattr(message, "tool_calls", None)
+                    if tool_calls:
+                        # Text before a tool call is the model thinking aloud, not the final answer
+                        answer_parts.clear()
+                        for call in tool_calls:
+                            queries = call["args"].get("queries") or list(call["args"].values())
+                            yield f"\n\n_Searching the knowledge base: {', '.join(map(str, queries))}_\n\n"
+                    elif isinstance(message, ToolMessage):
+                        yield f"_Found {len(message.artifact or [])} documents_\n\n"
+    
+    final_answer = "".join(answer_parts)
+    logger.info(f"Generated response length: {len(final_answer)} characters")
+    if on_complete:
+        on_complete(final_answer)
+
+
 def streamlit_ui():
     st.set_page_config("RAG on Bedrock with LangChain")
+
+    # Process-wide objects: the index, LLM and agent are loaded once, not on every question
+    retriever = get_retriever_service(INDEX_PATH, titan_embeddings, backend=RETRIEVER_BACKEND)
     st.header("RAG on Bedrock, powered by LangChain")
 
     user_question = st.text_input("Ask me about your QLED TV; e.g. What can I do to prevent it from falling?")
@@ -134,15 +171,24 @@ def streamlit_ui():
         if st.button("Actualiza Vector Store"):
             with st.spinner("Procesando..."):
                 logger.info("=== Starting Vector Store Update ===")
-                docs = data_ingestion()
-                setup_vector_store(docs)
+                # Incremental: only new/changed PDFs are parsed, and only new chunks are embedded
+                stats = ingest_directory(PDF_DIR, INDEX_PATH, titan_embeddings)
+                if stats['chunks_embedded'] or stats['chunks_deleted']:
+                    response_cache.clear()
+                # Ingestion removes the index when no chunks are left
+                if not os.path.exists(INDEX_PATH):
+                    retriever.unload()
                 logger.info("=== Vector Store Update Complete ===")
-                st.success("Listo!")
+                st.success(f"Listo! {stats['files_added']} nuevos, {stats['files_changed']} modificados, "
+                           f"{stats['files_removed']} eliminados, {stats['files_unchanged']} sin cambios. "
+                           f"Chunks embebidos: {stats['chunks_embedded']}, eliminados: {stats['chunks_deleted']}")
         
         if st.button("Borra Vector Store"):
-            if os.path.exists("faiss_index_electronics"):
+            if os.path.exists(INDEX_PATH):
                 logger.info("Deleting vector store directory...")
-                shutil.rmtree("faiss_index_electronics")
+                # Through the service, so queries stop using the index loaded in memory
+                retriever.delete()
+                response_cache.clear()
                 logger.info("Vector store deleted successfully")
                 st.success("Vector store cleared successfully!")
             else:
@@ -150,7 +196,7 @@ def streamlit_ui():
                 st.info("No vector store found to clear.")
 
     if st.button("Generate Response") or user_question:
-        if not os.path.exists("faiss_index_electronics"):
+        if retriever.get_vector_store() is None:
             st.error("Please create the vector store first from the sidebar.")
             return
         
@@ -158,18 +204,31 @@ def streamlit_ui():
             st.error("Please enter a question.")
             return
         
-        with st.spinner("Processing..."):
-            logger.info("=== Starting Query Processing ===")
-            logger.info("Loading FAISS vector store from disk...")
-            faiss_index = FAISS.load_local("faiss_index_electronics", embeddings=titan_embeddings,
-                                           allow_dangerous_deserialization=True)
-            logger.info("Vector store loaded successfully")
-            
-            llm = load_llm()
-            answer = get_response(llm, faiss_index, user_question)
-            st.write(answer)
-            logger.info("=== Query Processing Complete ===")
-            st.success("Done")
+        cache_lookup = dict(model_id=LLM_MODEL_ID,
+                            system=[{"text": system_prompt}],
+                            messages=[{"role": "user", "content": [{"text": user_question}]}])
+        cached = response_cache.get(**cache_lookup)
+        if cached is not None:
+            logger.info("Answer served from the response cache")
+            st.write(cached["text"])
+            st.success("Done (cached)")
+            return
+
+        logger.info("=== Starting Query Processing ===")
+        agent = get_shared_resource("rag_agent",
+                                    lambda: create_rag_agent(get_shared_resource("llm", load_llm), retriever))
+        if STREAMING:
+            # Progress and answer tokens show up as they arrive; only the answer is cached
+            st.write_stream(stream_response(agent, user_question,
+                                            on_complete=lambda answer: response_cache.put(response={"text": answer},
+                                                                                          **cache_lookup)))
+        else:
+            with st.spinner("Processing..."):
+                answer = get_response(agent, user_question)
+                response_cache.put(response={"text": answer}, **cache_lookup)
+                st.write(answer)
+        logger.info("=== Query Processing Complete ===")
+        st.success("Done")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+"""
+Benchmark of the retriever backends (bedrock_shared.retrievers): recall@k, QPS, latency and memory.
+
+Ground truth is the exact NumPy search, so recall@k is the fraction of the true top-k that a
+backend returns. Corpora:
+  - Synthetic: clustered unit vectors (embeddings of real text are clustered by topic, which is
+    what IVF relies on), one run per --sizes value.
+  - Real: the chunk vectors of a store written by ingestion.py (--index-path). Queries are
+    stored chunks plus noise, so no Bedrock calls are needed.
+
+Example:
+    python benchmark_retrievers.py --sizes 10000 100000 --dimensions 1024 --n-probe 4 8 16
+    python benchmark_retrievers.py --index-path faiss_index_electronics
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+# Make the repository-level bedrock_shared package importable when running from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared.retrievers import NumpyRetriever, build_retriever, normalize_rows
+from bedrock_shared.vector_store import MmapVectorStore
+
+
+def synthetic_corpus(count, dimensions, queries, clusters, spread, seed=0):
+    """Return (corpus, queries): unit vectors drawn around `clusters` random topic centers"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimensions), dtype=np.float32)
+
+    def sample(n):
+        points = centers[rng.integers(clusters, size=n)]
+        points += spread * rng.standard_normal((n, dimensions), dtype=np.float32)
+        return normalize_rows(points, copy=False)
+
+    return sample(count), sample(queries)
+
+
+def real_corpus(index_path, queries, noise, seed=0):
+    """Return (corpus, queries) from a stored index; queries are perturbed copies of random chunks"""
+    corpus = MmapVectorStore(index_path).vectors()
+    rng = np.random.default_rng(seed)
+    picked = np.asarray(corpus[rng.integers(len(corpus), size=queries)])
+    return corpus, normalize_rows(picked + noise * rng.standard_normal(picked.shape, dtype=np.float32))
+
+
+def recall_at_k(rows, truth):
+    k = truth.shape[1]
+    return statistics.mean(len(set(found[found >= 0]) & set(expected)) / k for found, expected in zip(rows, truth))
+
+
+def run_backend(label, build, queries, truth, k):
+    start = time.perf_counter()
+    retriever = build()
+    build_seconds = time.perf_counter() - start
+
+    # One query at a time: the access pattern of the RAG tool
+    latencies = []
+    rows = []
+    for query in queries:
+        start = time.perf_counter()
+        _, found = retriever.search(query, k)
+        latencies.append(time.perf_counter() - start)
+        rows.append(found[0])
+
+    # All queries in one call: multi-query retrieval / offline evaluation
+    start = time.perf_counter()
+    retriever.search(queries, k)
+    batch_seconds = time.perf_counter() - start
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        'backend': label,
+        'build_s': build_seconds,
+        'recall': recall_at_k(np.array(rows), truth),
+        'qps': len(queries) / sum(latencies),
+        'batch_qps': len(queries) / batch_seconds,
+        'p50_ms': latencies_ms[len(latencies_ms) // 2],
+        'p95_ms': latencies_ms[min(len(latencies_ms) - 1, int(len(latencies_ms) * 0.95))],
+        'memory_mb': retriever.nbytes / 2 ** 20,
+    }
+
+
+def benchmark(name, corpus, queries, args):
+    print(f"\n== {name}: {len(corpus)} vectors x {corpus.shape[1]} dims "
+          f"({corpus.nbytes / 2 ** 20:.0f} MB float32), {len(queries)} queries, k={args.k}")
+    _, truth = NumpyRetriever(corpus).search(queries, args.k)
+
+    configs = [('numpy', lambda: build_retriever('numpy', corpus))]
+    configs += [(f'ivf n_probe={n_probe}', lambda n_probe=n_probe: build_retriever(
+        'ivf', corpus, n_lists=args.n_lists, n_probe=n_probe)) for n_probe in args.n_probe]
+    configs.append(('faiss', lambda: build_retriever('faiss', corpus)))
+
+    results = []
+    print(f"{'backend':<18}{'build s':>9}{'recall@k':>10}{'QPS':>10}{'batch QPS':>11}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'memory MB':>11}")
+    for label, build in configs:
+        try:
+            result = run_backend(label, build, queries, truth, args.k)
+        except ImportError as e:
+            print(f"{label:<18}skipped ({e})")
+            continue
+        result['corpus'] = name
+        results.append(result)
+        print(f"{label:<18}{result['build_s']:>9.2f}{result['recall']:>10.3f}{result['qps']:>10.0f}"
+              f"{result['batch_qps']:>11.0f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}{result['memory_mb']:>11.1f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare NumPy, IVF and FAISS retrievers on synthetic and real vectors")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10_000, 100_000], help="Synthetic corpus sizes")
+    parser.add_argument("--dimensions", type=int, default=1024, help="Synthetic vector size (Titan v2: 256/512/1024)")
+    parser.add_argument("--clusters", type=int, default=2000, help="Topics in the synthetic corpus")
+    parser.add_argument("--spread", type=float, default=1.0, help="Per-dimension noise around each topic center")
+    parser.add_argument("--index-path", help="Also benchmark a store written by ingestion.py")
+    parser.add_argument("--noise", type=float, default=0.02, help="Per-dimension noise of the real-corpus queries")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per corpus")
+    parser.add_argument("-k", type=int, default=3, help="Results per query (the RAG tool uses 3)")
+    parser.add_argument("--n-lists", type=int, help="IVF partitions (default: sqrt(corpus size))")
+    parser.add_argument("--n-probe", type=int, nargs="*", default=[4, 8, 16], help="IVF partitions scanned per query")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    all_results = []
+    for size in args.sizes:
+        corpus, queries = synthetic_corpus(size, args.dimensions, args.queries, args.clusters, args.spread)
+        all_results += benchmark(f"synthetic-{size}", corpus, queries, args)
+    if args.index_path:
+        corpus, queries = real_corpus(args.index_path, args.queries, args.noise)
+        all_results += benchmark(os.path.basename(os.path.normpath(args.index_path)), corpus, queries, args)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, indent=2)
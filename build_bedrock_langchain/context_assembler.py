@@ -0,0 +1,158 @@
+"""
+Builds the context that the retrieval tool sends to the LLM, within a token budget.
+
+The knowledge base is split into 1000-character chunks with 250 characters of overlap, so hits
+from the same page often repeat text. The raw PyPDFLoader metadata (producer, creator, dates,
+total_pages, ...) is also repeated on every hit. The assembler:
+  1. Groups the hits by (source, page), keeping the retrieval rank of the best hit of each page.
+  2. Merges overlapping or contained chunks of the same page into one passage.
+  3. Writes a short header per passage ("[file.pdf, p. 12]") instead of the full metadata.
+  4. Adds passages by rank until the token budget is used up, cutting the last one at a
+     sentence boundary.
+
+Tokens are estimated locally (no API call), and the stats report how many were saved compared
+with the previous "Source: {metadata}\nContent: {text}" serialization.
+"""
+import re
+
+DEFAULT_MAX_TOKENS = 2000
+# Overlaps shorter than this are treated as coincidence, not as splitter overlap
+MIN_OVERLAP_CHARS = 20
+# Don't add a truncated passage when fewer tokens than this are left
+MIN_PASSAGE_TOKENS = 40
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+")
+
+
+def estimate_tokens(text):
+    """Fast local token estimate: ~4 characters per token for words, one token per punctuation mark"""
+    return sum((len(token) + 3) // 4 if token[0].isalnum() or token[0] == '_' else 1
+               for token in _TOKEN_PATTERN.findall(text))
+
+
+def raw_serialization(documents):
+    """The tool's previous serialization, used as the baseline for the savings report"""
+    return "\n\n".join(f"Source: {doc.metadata}\nContent: {doc.page_content}" for doc in documents)
+
+
+def merge_overlapping(first, second, min_overlap=MIN_OVERLAP_CHARS):
+    """
+    Merge two chunks of the same page if one contains the other, or if the end of one is the start
+    of the other. Returns the merged text, or None if they don't overlap.
+    """
+    if second in first:
+        return first
+    if first in second:
+        return second
+    for head, tail in ((first, second), (second, first)):
+        prefix = tail[:min_overlap]
+        start = head.find(prefix)
+        while start != -1:
+            if tail.startswith(head[start:]):
+                return head[:start] + tail
+            start = head.find(prefix, start + 1)
+    return None
+
+
+def _passage_key(metadata):
+    return metadata.get('source'), metadata.get('page')
+
+
+def _passage_header(metadata):
+    source = metadata.get('source') or 'unknown'
+    page = metadata.get('page_label') or (metadata['page'] + 1 if isinstance(metadata.get('page'), int) else None)
+    return f"[{source}, p. {page}]" if page is not None else f"[{source}]"
+
+
+def _merge_passage(texts):
+    """
+    Merge the chunks of one page; chunks that don't overlap are kept as separate paragraphs.
+
+    A merged chunk can overlap a paragraph it didn't overlap before (A+B with C), so merging is
+    repeated until no two paragraphs overlap, whatever the order of the chunks.
+    """
+    merged = list(texts)
+    changed = True
+    while changed:
+        changed = False
+        for i in range(len(merged)):
+            for j in range(i + 1, len(merged)):
+                combined = merge_overlapping(merged[i], merged[j])
+                if combined is not None:
+                    merged[i] = combined
+                    del merged[j]
+                    changed = True
+                    break
+            if changed:
+                break
+    return "\n".join(merged)
+
+
+def _page_order(docs):
+    """Chunks in page order when the splitter recorded start_index (add_start_index=True), else as retrieved"""
+    if all(isinstance(doc.metadata.get('start_index'), int) for doc in docs):
+        return sorted(docs, key=lambda doc: doc.metadata['start_index'])
+    return docs
+
+
+def _truncate(text, max_tokens, token_counter):
+    """Longest prefix of whole sentences that fits in max_tokens (empty if not even one fits)"""
+    kept = []
+    used = 0
+    for sentence in _SENTENCE_END.split(text):
+        tokens = token_counter(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def assemble_context(documents, max_tokens=DEFAULT_MAX_TOKENS, token_counter=estimate_tokens):
+    """
+    Serialize retrieved documents for the LLM: merged per page, short headers, within max_tokens.
+
+    Args:
+        documents: Retrieved LangChain Documents, best first.
+        max_tokens: Token budget for the whole context.
+        token_counter: Function estimating the tokens of a string.
+
+    Returns:
+        (context, stats): the context string and a dict with documents, passages, truncated, dropped,
+        tokens_before, tokens_after and tokens_saved.
+    """
+    passages = {}
+    for doc in documents:
+        passages.setdefault(_passage_key(doc.metadata), (doc.metadata, []))[1].append(doc)
+
+    sections = []
+    used = 0
+    truncated = dropped = 0
+    for metadata, docs in passages.values():
+        header = _passage_header(metadata)
+        body = _merge_passage([doc.page_content for doc in _page_order(docs)])
+        section_tokens = token_counter(header) + token_counter(body)
+        remaining = max_tokens - used - token_counter(header)
+        if used + section_tokens > max_tokens:
+            body = _truncate(body, remaining, token_counter) if remaining >= MIN_PASSAGE_TOKENS else ""
+            if not body:
+                dropped += 1
+                continue
+            truncated += 1
+            section_tokens = token_counter(header) + token_counter(body)
+        sections.append(f"{header}\n{body}")
+        used += section_tokens
+
+    context = "\n\n".join(sections)
+    tokens_before = token_counter(raw_serialization(documents))
+    tokens_after = token_counter(context)
+    return context, {
+        'documents': len(documents),
+        'passages': len(sections),
+        'truncated': truncated,
+        'dropped': dropped,
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': max(0, tokens_before - tokens_after),
+    }
@@ -0,0 +1,212 @@
+"""
+Incremental, parallel PDF ingestion for the FAISS knowledge base.
+
+Instead of re-reading, re-chunking and re-embedding every PDF on each update:
+  1. Every PDF is fingerprinted by content hash; only new or changed files are parsed,
+     in a process pool.
+  2. Every chunk gets an ID from its source, page and text. Chunks already in the index
+     (same ID) are not embedded again, and chunks that disappeared are deleted.
+  3. New chunks are embedded in batches, with bounded concurrency and retries on throttling.
+  4. Rows of unchanged chunks are copied from the existing (memory-mapped) store, the new rows are
+     appended, and the store is saved atomically together with the manifest of fingerprints.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# Make the repository-level bedrock_shared package importable when running from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared import MmapVectorStore, read_store_version, save_vector_store
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "ingestion_manifest.json"
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 250
+EMBEDDING_BATCH_SIZE = 16
+EMBEDDING_MAX_WORKERS = 4
+EMBEDDING_MAX_RETRIES = 6
+_THROTTLING_ERRORS = ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException')
+
+
+def file_fingerprint(path):
+    """SHA-256 of a file's content"""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def chunk_id(source, page, text, occurrence=0):
+    """Stable ID of a chunk; unchanged chunks keep their ID (and their vector) across updates"""
+    key = json.dumps([source, page, text, occurrence])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def parse_pdf(path, source, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """
+    Load and split one PDF. Runs in a worker process.
+
+    Returns:
+        List of (chunk ID, text, metadata) tuples.
+    """
+    documents = PyPDFLoader(path).load()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    seen = {}
+    for doc in splitter.split_documents(documents):
+        metadata = {**doc.metadata, 'source': source}
+        page = metadata.get('page')
+        base = (page, doc.page_content)
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        chunks.append((chunk_id(source, page, doc.page_content, occurrence), doc.page_content, metadata))
+    return chunks
+
+
+def _is_throttling(error):
+    code = getattr(error, 'response', {}).get('Error', {}).get('Code', '')
+    return code in _THROTTLING_ERRORS
+
+
+def _embed_batch(embeddings, texts, max_retries=EMBEDDING_MAX_RETRIES):
+    """Embed a batch, retrying with exponential backoff and jitter when Bedrock throttles"""
+    for attempt in range(max_retries + 1):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries or not _is_throttling(e):
+                raise
+            delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random() / 2)
+            logger.warning(f"Embedding throttled, retrying in {delay:.1f}s (attempt {attempt + 1}/{max_retries})")
+            time.sleep(delay)
+
+
+def embed_texts(embeddings, texts, batch_size=EMBEDDING_BATCH_SIZE, max_workers=EMBEDDING_MAX_WORKERS):
+    """Embed texts in batches with bounded concurrency, preserving order"""
+    if not texts:
+        return []
+
+    # EngineEmbeddings already dedupes, caches, fans out and rate-limits: hand it everything at once
+    if hasattr(embeddings, 'engine'):
+        return embeddings.engine.embed(texts).tolist()
+
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = pool.map(lambda batch: _embed_batch(embeddings, batch), batches)
+        return [vector for batch_vectors in results for vector in batch_vectors]
+
+
+def load_manifest(index_path):
+    """Return {source: {'sha256': ..., 'chunk_ids': [...]}} for the current index, or {}"""
+    try:
+        with open(os.path.join(index_path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def ingest_directory(pdf_dir, index_path, embeddings, max_parse_workers=None,
+                     embedding_batch_size=EMBEDDING_BATCH_SIZE, embedding_max_workers=EMBEDDING_MAX_WORKERS,
+                     dtype='float32'):
+    """
+    Bring the vector store at index_path up to date with the PDFs in pdf_dir.
+
+    Args:
+        dtype: Storage type of the vectors: 'float32', or 'float16' / 'int8' to quantize them.
+
+    Returns:
+        Dict with counts of added/changed/removed/unchanged files and embedded/deleted chunks.
+    """
+    manifest = load_manifest(index_path) if read_store_version(index_path) is not None else {}
+    # An index without a manifest (e.g. built by an older version of the app) is rebuilt from scratch
+    has_index = bool(manifest)
+
+    # 1. Fingerprint files and find what changed
+    current = {}
+    for name in sorted(os.listdir(pdf_dir)):
+        if name.lower().endswith('.pdf'):
+            path = os.path.join(pdf_dir, name)
+            current[name] = (path, file_fingerprint(path))
+
+    changed = [name for name, (_, sha) in current.items()
+               if manifest.get(name, {}).get('sha256') != sha]
+    removed = [name for name in manifest if name not in current]
+    stats = {'files_added': sum(1 for name in changed if name not in manifest),
+             'files_changed': sum(1 for name in changed if name in manifest),
+             'files_removed': len(removed),
+             'files_unchanged': len(current) - len(changed),
+             'chunks_embedded': 0,
+             'chunks_deleted': 0}
+    logger.info(f"Ingestion plan: {stats}")
+
+    if not changed and not removed:
+        return stats
+
+    # 2. Parse new/changed PDFs in parallel processes
+    parsed = {}
+    if changed:
+        with ProcessPoolExecutor(max_workers=max_parse_workers) as pool:
+            futures = {name: pool.submit(parse_pdf, current[name][0], name) for name in changed}
+            parsed = {name: future.result() for name, future in futures.items()}
+
+    # 3. Diff chunk IDs against the manifest
+    existing_ids = {cid for entry in manifest.values() for cid in entry['chunk_ids']}
+    new_manifest = {name: entry for name, entry in manifest.items() if name in current}
+    wanted_ids = set()
+    to_embed = []
+    for name, chunks in parsed.items():
+        new_manifest[name] = {'sha256': current[name][1], 'chunk_ids': [cid for cid, _, _ in chunks]}
+        for cid, text, metadata in chunks:
+            if cid not in wanted_ids and cid not in existing_ids:
+                to_embed.append((cid, text, metadata))
+            wanted_ids.add(cid)
+
+    kept_ids = {cid for entry in new_manifest.values() for cid in entry['chunk_ids']}
+    to_delete = list(existing_ids - kept_ids)
+
+    # 4. Embed only the new chunks
+    vectors = embed_texts(embeddings, [text for _, text, _ in to_embed],
+                          batch_size=embedding_batch_size, max_workers=embedding_max_workers)
+
+    stats['chunks_embedded'] = len(to_embed)
+    stats['chunks_deleted'] = len(to_delete)
+
+    # 5. Copy the kept rows of the existing store, append the new ones, then save atomically with the manifest
+    ids, texts, metadatas, parts = [], [], [], []
+    if has_index:
+        store = MmapVectorStore(index_path)
+        kept_rows = [row for row, cid in enumerate(store.ids) if cid in kept_ids]
+        for cid, text, metadata in store.rows(kept_rows):
+            ids.append(cid)
+            texts.append(text)
+            metadatas.append(metadata)
+        if kept_rows:
+            parts.append(store.vectors(kept_rows))
+    for cid, text, metadata in to_embed:
+        ids.append(cid)
+        texts.append(text)
+        metadatas.append(metadata)
+    if to_embed:
+        parts.append(np.asarray(vectors, dtype=np.float32))
+
+    if not ids:
+        logger.warning("No chunks left to index; removing the index")
+        shutil.rmtree(index_path, ignore_errors=True)
+        return stats
+
+    save_vector_store(index_path, ids, np.concatenate(parts), texts, metadatas, dtype=dtype,
+                      extra_files={MANIFEST_FILE: json.dumps(new_manifest)})
+    logger.info(f"Ingestion complete: {stats}")
+    return stats
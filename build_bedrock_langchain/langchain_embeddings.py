@@ -0,0 +1,20 @@
+"""
+LangChain Embeddings adapter over bedrock_shared.EmbeddingEngine.
+
+Lets FAISS (and the rest of LangChain) use the batched, cached, rate-limited engine instead of
+BedrockEmbeddings, which makes one synchronous request per text.
+"""
+from langchain_core.embeddings import Embeddings
+
+
+class EngineEmbeddings(Embeddings):
+    """LangChain-compatible wrapper; the engine itself is available as .engine for matrix access"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def embed_documents(self, texts):
+        return self.engine.embed(texts).tolist()
+
+    def embed_query(self, text):
+        return self.engine.embed_query(text).tolist()
@@ -0,0 +1,200 @@
+"""
+Process-wide retriever service for the RAG app.
+
+Streamlit re-executes app-faiss-kb.py on every interaction, but imported modules stay loaded,
+so objects kept here live for the whole process:
+  - The index is loaded once and shared by every session. It is stored with
+    bedrock_shared.vector_store (memory-mapped float32 vectors + JSON sidecars, no pickle)
+    and the search backend (exact NumPy, IVF or FAISS; see bedrock_shared.retrievers) is built from it.
+  - Each save gets a new version in the store manifest. The first query that sees a new version
+    loads that index and swaps it in atomically, so other queries never see a half-loaded index.
+    While the folder is missing or incomplete (e.g. during save_vector_store's folder swap) the
+    loaded index keeps being served; it is only dropped by RetrieverService.delete / unload.
+  - Expensive objects such as the LLM and the agent graph are built once (get_shared_resource).
+"""
+import logging
+import os
+import shutil
+import sys
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Make the repository-level bedrock_shared package importable when running from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared import MmapVectorStore, read_store_version
+from bedrock_shared.retrievers import build_retriever, mmr, normalize_rows
+
+logger = logging.getLogger(__name__)
+
+
+class VectorIndex:
+    """
+    One loaded version of the store: the memory-mapped chunks plus a search backend over their vectors.
+
+    Args:
+        store: MmapVectorStore with the chunks.
+        embeddings: LangChain embeddings used to embed queries.
+        backend: 'auto', 'numpy', 'ivf' or 'faiss' (see bedrock_shared.retrievers).
+        backend_kwargs: Backend settings, e.g. {'n_probe': 16} for IVF.
+    """
+
+    def __init__(self, store, embeddings, backend='auto', **backend_kwargs):
+        self.store = store
+        self.embeddings = embeddings
+        self.retriever = build_retriever(backend, store.vectors(), **backend_kwargs)
+
+    def similarity_search_by_vector(self, embedding, k=3):
+        _, rows = self.retriever.search(np.asarray(embedding, dtype=np.float32), k)
+        return [Document(page_content=text, metadata=metadata, id=chunk_id)
+                for chunk_id, text, metadata in self.store.rows(row for row in rows[0] if row >= 0)]
+
+    def similarity_search(self, query, k=3):
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+
+    def _embed_queries(self, queries):
+        # EngineEmbeddings embeds the whole batch concurrently (and from cache) as one float32 matrix
+        if hasattr(self.embeddings, 'engine'):
+            return self.embeddings.engine.embed(queries)
+        return np.asarray(self.embeddings.embed_documents(queries), dtype=np.float32)
+
+    def multi_query_search(self, queries, k=3, use_mmr=False, fetch_k=20, lambda_mult=0.5):
+        """
+        Search several queries at once: one embedding batch and one search call for all of them.
+
+        Args:
+            queries: Search queries (e.g. one per sub-question).
+            k: Chunks per query; at most k * len(queries) distinct chunks are returned.
+            use_mmr: Re-rank the pooled candidates with maximal marginal relevance, so near-duplicate
+                chunks are not all sent to the LLM.
+            fetch_k: Candidates fetched per query for MMR.
+            lambda_mult: MMR trade-off between relevance (1.0) and diversity (0.0).
+
+        Returns:
+            List of Documents, without duplicates.
+        """
+        queries = list(dict.fromkeys(query.strip() for query in queries if query and query.strip()))
+        if not queries:
+            return []
+        limit = k * len(queries)
+
+        query_vectors = normalize_rows(self._embed_queries(queries))
+        _, rows = self.retriever.search(query_vectors, max(fetch_k, k) if use_mmr else k)
+
+        if use_mmr:
+            candidates = np.unique(rows[rows >= 0])
+            vectors = normalize_rows(self.store.vectors(candidates))
+            # A chunk is as relevant as its best match among the queries
+            relevance = (vectors @ query_vectors.T).max(axis=1)
+            ordered = [int(candidates[i]) for i in mmr(relevance, vectors, limit, lambda_mult)]
+        else:
+            # Round-robin over the per-query rankings, so every query contributes its best chunks
+            ordered = list(dict.fromkeys(int(row) for row in rows.T.ravel() if row >= 0))
+
+        documents = []
+        seen_texts = set()
+        for chunk_id, text, metadata in self.store.rows(ordered):
+            # The same text can be stored under several IDs (e.g. repeated across PDFs)
+            if text not in seen_texts:
+                seen_texts.add(text)
+                documents.append(Document(page_content=text, metadata=metadata, id=chunk_id))
+        return documents[:limit]
+
+
+class RetrieverService:
+    """
+    Shares one vector index across sessions and reloads it when the on-disk version changes.
+
+    Args:
+        index_path: Store folder written by bedrock_shared.save_vector_store.
+        embeddings: LangChain embeddings used to embed queries.
+        backend: Search backend: 'auto', 'numpy', 'ivf' or 'faiss'.
+        backend_kwargs: Backend settings, e.g. {'n_probe': 16} for IVF.
+    """
+
+    def __init__(self, index_path, embeddings, backend='auto', **backend_kwargs):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self.backend = backend
+        self.backend_kwargs = backend_kwargs
+        self._vector_store = None
+        self._version = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def get_vector_store(self):
+        """
+        Return the current vector store, loading or reloading it if the on-disk version changed.
+
+        Returns None if no index was loaded yet and there is none on disk.
+        """
+        disk_version = read_store_version(self.index_path)
+        if disk_version is None:
+            # Missing manifest: most likely save_vector_store's folder swap, keep serving the loaded index
+            return self._vector_store
+
+        if disk_version != self._version:
+            with self._reload_lock:
+                if disk_version != self._version:
+                    logger.info(f"Loading index version {disk_version} from '{self.index_path}'...")
+                    vector_store = VectorIndex(MmapVectorStore(self.index_path), self.embeddings,
+                                               self.backend, **self.backend_kwargs)
+                    # Single reference swap: in-flight queries keep using the previous store
+                    self._vector_store, self._version = vector_store, disk_version
+                    logger.info(f"Index loaded ({vector_store.retriever.name} backend, "
+                                f"{len(vector_store.retriever)} vectors)")
+        return self._vector_store
+
+    def unload(self):
+        """Forget the loaded index (e.g. after its folder was removed); the next query loads it again if it exists"""
+        with self._reload_lock:
+            self._vector_store, self._version = None, None
+
+    def delete(self):
+        """Remove the index folder and stop serving it"""
+        with self._reload_lock:
+            shutil.rmtree(self.index_path, ignore_errors=True)
+            self._vector_store, self._version = None, None
+
+    def similarity_search(self, query, k=3):
+        vector_store = self.get_vector_store()
+        if vector_store is None:
+            return []
+        return vector_store.similarity_search(query, k=k)
+
+    def multi_query_search(self, queries, k=3, **kwargs):
+        vector_store = self.get_vector_store()
+        if vector_store is None:
+            return []
+        return vector_store.multi_query_search(queries, k=k, **kwargs)
+
+
+_services = {}
+_resources = {}
+# Re-entrant: a resource factory may itself call get_shared_resource (e.g. the agent needs the LLM)
+_lock = threading.RLock()
+
+
+def get_retriever_service(index_path, embeddings, backend='auto', **backend_kwargs):
+    """Return the process-wide RetrieverService for an index folder (backend settings only apply on first creation)"""
+    index_path = os.path.abspath(index_path)
+    with _lock:
+        service = _services.get(index_path)
+        if service is None:
+            service = _services[index_path] = RetrieverService(index_path, embeddings, backend, **backend_kwargs)
+    return service
+
+
+def get_shared_resource(name, factory):
+    """Build a resource (e.g. the LLM or the agent) once per process and reuse it"""
+    resource = _resources.get(name)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(name)
+            if resource is None:
+                resource = _resources[name] = factory()
+    return resource
@@ -0,0 +1,119 @@
+"""
+Concurrency benchmark of the SQLite MCP tools: N agents calling list_users / add_user in parallel.
+
+Compares the previous implementation (a new aiosqlite connection per call, one commit per insert)
+with SQLitePool (long-lived WAL connections, group-committed writes). The tool bodies are called
+in-process, so the numbers are the database layer's, without the MCP transport.
+
+Example:
+    python benchmark_sqlite_tools.py --agents 50 --calls 40 --write-ratio 0.5
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import aiosqlite
+
+from sqlite_pool import SQLitePool
+
+CREATE_USERS = "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL)"
+
+
+class PerCallTools:
+    """The tools as they were: connect, run one statement, commit, close"""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def setup(self):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute(CREATE_USERS)
+            await db.commit()
+
+    async def list_users(self):
+        async with aiosqlite.connect(self.path) as db:
+            cur = await db.execute("SELECT id, name FROM users")
+            rows = await cur.fetchall()
+            await cur.close()
+        return [{"id": r[0], "name": r[1]} for r in rows]
+
+    async def add_user(self, name):
+        async with aiosqlite.connect(self.path) as db:
+            await db.execute("INSERT INTO users (name) VALUES (?)", (name,))
+            await db.commit()
+        return f"User {name} added."
+
+    async def close(self):
+        pass
+
+
+class PooledTools:
+    """The tools on top of SQLitePool, as in sqlite_mcp_server.py"""
+
+    def __init__(self, path, readers):
+        self.pool = SQLitePool(path, readers=readers)
+
+    async def setup(self):
+        await self.pool.open()
+        await self.pool.execute_write(CREATE_USERS)
+
+    async def list_users(self):
+        rows = await self.pool.fetchall("SELECT id, name FROM users")
+        return [{"id": r[0], "name": r[1]} for r in rows]
+
+    async def add_user(self, name):
+        await self.pool.execute_write("INSERT INTO users (name) VALUES (?)", (name,))
+        return f"User {name} added."
+
+    async def close(self):
+        await self.pool.close()
+
+
+async def agent(tools, agent_id, calls, write_ratio, latencies, rng):
+    for i in range(calls):
+        start = time.perf_counter()
+        if rng.random() < write_ratio:
+            await tools.add_user(f"agent{agent_id}-{i}")
+            latencies['add_user'].append(time.perf_counter() - start)
+        else:
+            await tools.list_users()
+            latencies['list_users'].append(time.perf_counter() - start)
+
+
+async def run(label, tools, args):
+    await tools.setup()
+    latencies = {'add_user': [], 'list_users': []}
+    rng = random.Random(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(agent(tools, i, args.calls, args.write_ratio, latencies, rng) for i in range(args.agents)))
+    elapsed = time.perf_counter() - start
+    await tools.close()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"\n== {label}: {total} calls in {elapsed:.2f} s -> {total / elapsed:.0f} calls/s")
+    for tool, values in latencies.items():
+        if values:
+            ms = sorted(v * 1000 for v in values)
+            print(f"  {tool:<11} n={len(ms):<6} p50={ms[len(ms) // 2]:.1f} ms  "
+                  f"p95={ms[int(len(ms) * 0.95)]:.1f} ms  mean={statistics.mean(ms):.1f} ms")
+    if isinstance(tools, PooledTools):
+        print(f"  group commit: {tools.pool.writes} writes in {tools.pool.batches} transactions")
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        await run("per-call connections", PerCallTools(os.path.join(tmp, "per_call.db")), args)
+        await run(f"SQLitePool ({args.readers} readers)", PooledTools(os.path.join(tmp, "pooled.db"), args.readers), args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="N parallel agents calling the SQLite MCP tools")
+    parser.add_argument("--agents", type=int, default=50, help="Concurrent agents")
+    parser.add_argument("--calls", type=int, default=40, help="Tool calls per agent")
+    parser.add_argument("--write-ratio", type=float, default=0.5, help="Fraction of calls that are add_user")
+    parser.add_argument("--readers", type=int, default=4, help="Reader connections in the pool")
+    asyncio.run(main(parser.parse_args()))
@@ -1,9 +1,6 @@
 import streamlit as st
 import boto3
-from strands import Agent
-from strands.models import BedrockModel
-from strands.tools.mcp import MCPClient
-from mcp.client.streamable_http import streamablehttp_client
+from mcp_session_pool import get_mcp_session_pool
 
 # Configuration
 region = boto3.session.Session().region_name
@@ -38,30 +35,20 @@ custom_question = st.text_area("Or enter your own question:")
 
 question = custom_question if custom_question else selected_question
 
+SYSTEM_PROMPT = """You are a trading assistant that can execute trades and send trade details. 
+                Always provide clear confirmation of actions taken and include relevant details like trade IDs, 
+                timestamps, and status information."""
+
+# MCP sessions, tool lists and agents survive Streamlit reruns (shared by the whole process)
+mcp_pool = get_mcp_session_pool()
+
 # Function to create and run agent
 def run_trading_agent(question, mcp_url, model_id):
-    """Connect to MCP server and run the strands agent with the question"""
+    """Run the strands agent with the question, reusing the MCP session and agent of previous questions"""
     try:
-        st.info("🔄 Connecting to MCP Server...")
-        
-        # Connect to the MCP server
-        trading_server = MCPClient(lambda: streamablehttp_client(mcp_url))
-        
-        with trading_server:
-            # Get available tools
-            mcp_tools = trading_server.list_tools_sync()
-            tool_names = [tool.tool_name for tool in mcp_tools]
-            
-            st.success(f"✅ Connected! Available tools: {tool_names}")
-            
-            # Create agent with MCP tools
-            agent = Agent(
-                model=BedrockModel(model_id=model_id),
-                system_prompt="""You are a trading assistant that can execute trades and send trade details. 
-                Always provide clear confirmation of actions taken and include relevant details like trade IDs, 
-                timestamps, and status information.""",
-                tools=mcp_tools,
-            )
+        # Checks out an agent built with the server's (cached) tools; the session is reused
+        with mcp_pool.agent(mcp_url, model_id, SYSTEM_PROMPT) as (agent, tool_names):
+            st.success(f"✅ MCP tools: {tool_names}")
             
             st.info("🤖 Processing question with agent...")
             
@@ -78,13 +65,14 @@ def run_trading_agent(question, mcp_url, model_id):
 st.subheader("MCP Server Status")
 if st.button("Test Connection"):
     try:
-        trading_server = MCPClient(lambda: streamablehttp_client(mcp_url))
-        with trading_server:
-            mcp_tools = trading_server.list_tools_sync()
-            tool_names = [tool.tool_name for tool in mcp_tools]
-            st.success(f"✅ Connected to MCP Server")
-            st.info(f"Available tools: {tool_names}")
+        # Pings the pooled session (reconnecting if needed) and lists the tools again
+        mcp_pool.session(mcp_url, check=True)
+        _, mcp_tools = mcp_pool.tools(mcp_url, refresh=True)
+        tool_names = [tool.tool_name for tool in mcp_tools]
+        st.success(f"✅ Connected to MCP Server")
+        st.info(f"Available tools: {tool_names}")
     except Exception as e:
+        mcp_pool.invalidate(mcp_url)
         st.error(f"❌ Connection failed: {str(e)}")
 
 # Main interaction area
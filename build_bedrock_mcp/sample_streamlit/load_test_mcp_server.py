@@ -0,0 +1,214 @@
+"""
+Load test for the streamable-HTTP trading MCP server (mcp_server.py).
+
+For every combination of session mode (stateless / stateful) and uvicorn worker count, the
+harness starts the server locally, runs N concurrent MCP clients that each open a session and
+call the tools with the configured mix, and reports throughput and p50/p95/p99 latency per tool.
+Clients can be spread over several processes so the load generator isn't the bottleneck.
+
+Stateful sessions live in the memory of the worker that created them, and uvicorn doesn't route
+a session's requests back to the same worker: stateful mode is only run with 1 worker.
+
+Example:
+    python load_test_mcp_server.py --modes stateless,stateful --workers 1,4 --clients 64 --calls 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TOOL_ARGUMENTS = {
+    "executeTrade": lambda rng: {"ticker": rng.choice(["AMZN", "TSLA", "MSFT"]),
+                                 "quantity": rng.randint(1, 1000),
+                                 "price": round(rng.uniform(10, 500), 2)},
+    "sendTradeDetails": lambda rng: {"tradeId": f"T{rng.randint(10000, 99999)}"},
+}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def parse_mix(mix):
+    """'executeTrade=0.7,sendTradeDetails=0.3' -> ([names], [weights])"""
+    tools, weights = [], []
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in TOOL_ARGUMENTS:
+            raise ValueError(f"Unknown tool {name}, available: {list(TOOL_ARGUMENTS)}")
+        tools.append(name)
+        weights.append(float(weight or 1))
+    return tools, weights
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, workers, stateless, timeout=30):
+    # FastMCP logs every request at INFO
+    env = dict(os.environ, MCP_STATELESS_HTTP="1" if stateless else "0", MCP_LOG_LEVEL="WARNING")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "mcp_server:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=HERE, env=env)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The MCP server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"The MCP server did not start in {timeout} s")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+async def run_client(url, calls, tools, weights, seed, latencies, errors):
+    rng = random.Random(seed)
+    async with streamablehttp_client(url) as (read_stream, write_stream, _):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            for _ in range(calls):
+                tool = rng.choices(tools, weights)[0]
+                start = time.perf_counter()
+                try:
+                    result = await session.call_tool(tool, TOOL_ARGUMENTS[tool](rng))
+                    if result.isError:
+                        errors[tool] = errors.get(tool, 0) + 1
+                        continue
+                except Exception:
+                    errors[tool] = errors.get(tool, 0) + 1
+                    continue
+                latencies.setdefault(tool, []).append(time.perf_counter() - start)
+
+
+async def run_clients(url, clients, calls, tools, weights, seed):
+    latencies, errors = {}, {}
+    results = await asyncio.gather(
+        *(run_client(url, calls, tools, weights, seed + i, latencies, errors) for i in range(clients)),
+        return_exceptions=True)
+    # A client that couldn't open its session counts all its calls as errors
+    failed = sum(1 for result in results if isinstance(result, Exception))
+    if failed:
+        errors["session"] = errors.get("session", 0) + failed * calls
+    return latencies, errors
+
+
+def client_process(url, clients, calls, tools, weights, seed):
+    """Runs in a worker process; wall-clock times so the parent can merge several processes"""
+    start = time.time()
+    latencies, errors = asyncio.run(run_clients(url, clients, calls, tools, weights, seed))
+    return start, time.time(), latencies, errors
+
+
+def run_load(url, args, tools, weights):
+    # Spread the clients over the processes (the first ones take the remainder)
+    shares = [args.clients // args.client_processes + (i < args.clients % args.client_processes)
+              for i in range(args.client_processes)]
+    shares = [share for share in shares if share]
+    with ProcessPoolExecutor(max_workers=len(shares)) as executor:
+        futures = [executor.submit(client_process, url, share, args.calls, tools, weights, 1000 * i)
+                   for i, share in enumerate(shares)]
+        outputs = [future.result() for future in futures]
+
+    latencies, errors = {}, {}
+    for _, _, process_latencies, process_errors in outputs:
+        for tool, values in process_latencies.items():
+            latencies.setdefault(tool, []).extend(values)
+        for tool, count in process_errors.items():
+            errors[tool] = errors.get(tool, 0) + count
+    elapsed = max(output[1] for output in outputs) - min(output[0] for output in outputs)
+    return elapsed, latencies, errors
+
+
+def summarize(values):
+    ms = [value * 1000 for value in values]
+    return {"calls": len(ms), "p50_ms": percentile(ms, 50), "p95_ms": percentile(ms, 95), "p99_ms": percentile(ms, 99)}
+
+
+def benchmark(mode, workers, args, tools, weights):
+    port = free_port()
+    process = start_server(port, workers, stateless=(mode == "stateless"))
+    url = f"http://127.0.0.1:{port}/mcp"
+    try:
+        # Warm-up: imports, first connections
+        asyncio.run(run_clients(url, 2, 5, tools, weights, seed=-1))
+        elapsed, latencies, errors = run_load(url, args, tools, weights)
+    finally:
+        stop_server(process)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    ok = len(all_latencies)
+    return {"mode": mode, "workers": workers, "clients": args.clients, "seconds": elapsed,
+            "calls_per_s": ok / elapsed if elapsed else 0.0, "errors": sum(errors.values()),
+            "all": summarize(all_latencies) if all_latencies else None,
+            "tools": {tool: summarize(values) for tool, values in sorted(latencies.items())}}
+
+
+def print_result(result):
+    print(f"\n== {result['mode']}, {result['workers']} worker(s), {result['clients']} clients: "
+          f"{result['calls_per_s']:.0f} calls/s in {result['seconds']:.2f} s, {result['errors']} errors")
+    rows = ([("all", result["all"])] if result["all"] else []) + list(result["tools"].items())
+    for name, stats in rows:
+        print(f"  {name:<17} n={stats['calls']:<7} p50={stats['p50_ms']:.1f} ms  "
+              f"p95={stats['p95_ms']:.1f} ms  p99={stats['p99_ms']:.1f} ms")
+
+
+def main(args):
+    tools, weights = parse_mix(args.mix)
+    results = []
+    for mode in args.modes.split(","):
+        for workers in (int(w) for w in args.workers.split(",")):
+            if mode == "stateful" and workers > 1:
+                print(f"\n== stateful, {workers} workers: skipped (sessions are not shared between workers)")
+                continue
+            result = benchmark(mode, workers, args, tools, weights)
+            print_result(result)
+            results.append(result)
+
+    print("\nmode       workers  calls/s    p50 ms   p95 ms   p99 ms  errors")
+    for r in results:
+        stats = r["all"] or {"p50_ms": 0, "p95_ms": 0, "p99_ms": 0}
+        print(f"{r['mode']:<10} {r['workers']:>7} {r['calls_per_s']:>8.0f} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f} {r['errors']:>7}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency of the trading MCP server under concurrent clients")
+    parser.add_argument("--modes", default="stateless,stateful", help="Comma-separated session modes")
+    parser.add_argument("--workers", default="1,4", help="Comma-separated uvicorn worker counts")
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent MCP clients (one session each)")
+    parser.add_argument("--calls", type=int, default=50, help="Tool calls per client")
+    parser.add_argument("--mix", default="executeTrade=0.5,sendTradeDetails=0.5", help="Tool call mix (tool=weight,...)")
+    parser.add_argument("--client-processes", type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)),
+                        help="Processes the clients are spread over")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    main(parser.parse_args())
@@ -1,6 +1,9 @@
+import os
 from mcp.server.fastmcp import FastMCP
 
-mcp = FastMCP(host="0.0.0.0", stateless_http=True)
+# MCP_STATELESS_HTTP=0 keeps a session per client (needed for server notifications, but pins each client to one process)
+mcp = FastMCP(host="0.0.0.0", stateless_http=os.environ.get("MCP_STATELESS_HTTP", "1") == "1",
+              log_level=os.environ.get("MCP_LOG_LEVEL", "INFO"))
 
 @mcp.tool()
 async def executeTrade(ticker, quantity, price):
@@ -38,5 +41,8 @@ async def sendTradeDetails(tradeId):
         "timestamp": "2025-04-09T22:59:00"
     }
 
+# ASGI app, to serve with several worker processes: uvicorn mcp_server:app --workers 4
+app = mcp.streamable_http_app()
+
 if __name__ == "__main__":
     mcp.run(transport="streamable-http")
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""
+Process-wide MCP sessions, tool listings and agents for the Streamlit trading app.
+
+Streamlit reruns the script on every interaction, and every question used to open a new MCP
+session (HTTP connection + initialize handshake), list the tools and build a new Agent and
+BedrockModel. This module keeps, per server URL:
+  - One started MCPClient, checked with a ping when it has been idle for health_check_seconds
+    and reconnected if the ping fails.
+  - Its tool list, refreshed after tool_ttl_seconds or when the server sends a
+    notifications/tools/list_changed message.
+  - Idle Agent instances per (model ID, tool set). A question checks one out (building it only
+    if none is idle), so concurrent users never share an agent's conversation.
+
+Usage:
+    pool = get_mcp_session_pool()
+    with pool.agent(mcp_url, model_id, system_prompt) as (agent, tool_names):
+        response = agent(question)
+"""
+import atexit
+import contextlib
+import logging
+import threading
+import time
+
+from mcp import types
+from mcp.client.streamable_http import streamablehttp_client
+from strands import Agent
+from strands.models import BedrockModel
+from strands.tools.mcp import MCPClient
+
+logger = logging.getLogger(__name__)
+
+
+class NotifyingMCPClient(MCPClient):
+    """
+    MCPClient that records tools/list_changed notifications and can ping the server.
+
+    strands' MCPClient has no public hook for either, so this relies on its private members
+    (_handle_error_message, _background_thread_session, _is_session_active and
+    _invoke_on_background_thread), as they are in strands-agents 1.14 and 1.15: the
+    ">=1.14.0,<1.16.0" pin of the root requirements.txt and "==1.15.0" in this folder's
+    requirements.txt. Check them when moving either pin. If they are
+    missing, ping() reports the session as unhealthy (it is reconnected) and tool lists are only
+    refreshed by TTL.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tools_changed = threading.Event()
+
+    # MCPClient passes this method to the ClientSession as its message handler
+    async def _handle_error_message(self, message):
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self.tools_changed.set()
+        await super()._handle_error_message(message)
+
+    def ping(self, timeout):
+        session = getattr(self, '_background_thread_session', None)
+        is_active = getattr(self, '_is_session_active', None)
+        invoke = getattr(self, '_invoke_on_background_thread', None)
+        if session is None or is_active is None or invoke is None or not is_active():
+            return False
+        try:
+            invoke(session.send_ping()).result(timeout=timeout)
+            return True
+        except Exception as e:
+            logger.warning(f"MCP ping failed: {e}")
+            return False
+
+
+class _Session:
+    __slots__ = ('client', 'tools', 'tools_time', 'last_used', 'generation')
+
+    def __init__(self, client, generation):
+        self.client = client
+        self.tools = None
+        self.tools_time = 0.0
+        self.last_used = time.monotonic()
+        self.generation = generation
+
+
+class MCPSessionPool:
+    """
+    Args:
+        tool_ttl_seconds: Maximum age of a cached tool list.
+        health_check_seconds: A session idle for longer than this is pinged before it is used.
+        ping_timeout: Seconds to wait for the ping answer.
+        startup_timeout: Seconds to wait for a new session's initialize handshake.
+        max_idle_agents: Idle agents kept per (URL, model ID, tool set).
+    """
+
+    def __init__(self, tool_ttl_seconds=300, health_check_seconds=30, ping_timeout=5, startup_timeout=30,
+                 max_idle_agents=4):
+        self.tool_ttl_seconds = tool_ttl_seconds
+        self.health_check_seconds = health_check_seconds
+        self.ping_timeout = ping_timeout
+        self.startup_timeout = startup_timeout
+        self.max_idle_agents = max_idle_agents
+        self._sessions = {}
+        self._idle_agents = {}
+        self._models = {}
+        self._generation = 0
+        # Short critical sections on the dicts above; never held during network I/O
+        self._lock = threading.Lock()
+        # One lock per URL serializes connect / ping / list_tools for that server only, so a slow or
+        # unreachable server doesn't block questions to the others. Re-entrant: tools() calls session().
+        self._url_locks = {}
+
+    def _url_lock(self, url):
+        with self._lock:
+            return self._url_locks.setdefault(url, threading.RLock())
+
+    def _connect(self, url):
+        client = NotifyingMCPClient(lambda: streamablehttp_client(url), startup_timeout=self.startup_timeout)
+        client.start()
+        with self._lock:
+            self._generation += 1
+            session = self._sessions[url] = _Session(client, self._generation)
+        logger.info(f"MCP session opened: {url}")
+        return session
+
+    def session(self, url, check=False):
+        """Started session for url; pinged first if idle for a while (or if check), reconnected if dead"""
+        with self._url_lock(url):
+            with self._lock:
+                session = self._sessions.get(url)
+            now = time.monotonic()
+            if session is not None and (check or now - session.last_used > self.health_check_seconds):
+                if not session.client.ping(self.ping_timeout):
+                    self._drop(url)
+                    session = None
+            if session is None:
+                session = self._connect(url)
+            session.last_used = now
+            return session
+
+    def tools(self, url, refresh=False):
+        """Returns (session, tools): the tool list is listed again on TTL expiry or a list_changed notification"""
+        with self._url_lock(url):
+            session = self.session(url)
+            expired = time.monotonic() - session.tools_time > self.tool_ttl_seconds
+            if refresh or expired or session.tools is None or session.client.tools_changed.is_set():
+                session.client.tools_changed.clear()
+                tools = list(session.client.list_tools_sync())
+                if session.tools is not None and self._tool_names(tools) != self._tool_names(session.tools):
+                    logger.info(f"MCP tools changed on {url}: {self._tool_names(tools)}")
+                session.tools, session.tools_time = tools, time.monotonic()
+            return session, session.tools
+
+    @staticmethod
+    def _tool_names(tools):
+        return tuple(sorted(tool.tool_name for tool in tools))
+
+    def _model(self, model_id):
+        # BedrockModel (and its boto3 client) is thread-safe and shared by every agent of a model
+        with self._lock:
+            if model_id not in self._models:
+                self._models[model_id] = BedrockModel(model_id=model_id)
+            return self._models[model_id]
+
+    @contextlib.contextmanager
+    def agent(self, url, model_id, system_prompt):
+        """
+        Check out an Agent with the server's current tools, with an empty conversation.
+
+        Yields:
+            (agent, tool_names)
+        """
+        session, tools = self.tools(url)
+        tool_names = self._tool_names(tools)
+        key = (url, session.generation, model_id, system_prompt, tool_names)
+        with self._lock:
+            idle = self._idle_agents.setdefault(key, [])
+            agent = idle.pop() if idle else None
+        if agent is None:
+            agent = Agent(model=self._model(model_id), system_prompt=system_prompt, tools=tools)
+        agent.messages.clear()
+        try:
+            yield agent, list(tool_names)
+        except Exception:
+            # The session may be broken: reconnect on the next question
+            self.invalidate(url)
+            raise
+        with self._lock:
+            idle = self._idle_agents.get(key)
+            if idle is not None and len(idle) < self.max_idle_agents:
+                idle.append(agent)
+
+    def _drop(self, url):
+        with self._lock:
+            session = self._sessions.pop(url, None)
+            # Agents hold tools bound to the old client
+            for key in [key for key in self._idle_agents if key[0] == url]:
+                del self._idle_agents[key]
+        if session is not None:
+            with contextlib.suppress(Exception):
+                session.client.stop(None, None, None)
+            logger.info(f"MCP session closed: {url}")
+
+    def invalidate(self, url):
+        """Close the session for url; the next use reconnects and lists the tools again"""
+        with self._url_lock(url):
+            self._drop(url)
+
+    def close(self):
+        with self._lock:
+            urls = list(self._sessions)
+        for url in urls:
+            self.invalidate(url)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_mcp_session_pool(**kwargs):
+    """Return the process-wide MCPSessionPool (kwargs only apply on first creation)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = MCPSessionPool(**kwargs)
+                atexit.register(_pool.close)
+    return _pool
@@ -1,37 +1,140 @@
 #!/usr/bin/env python3
-import asyncio, aiosqlite, os
+import asyncio, base64, contextlib, json, os
+from typing import Optional
 from mcp.server.fastmcp import FastMCP
+from sqlite_pool import SQLitePool
+from sqlite_query_guard import QueryGuard
 
 DB_PATH = os.path.join(os.path.dirname(__file__), "demo.db")
 mcp = FastMCP("sqlite-demo-server")
 
+# Connections are opened once and shared by every tool call (WAL readers + one group-committing writer)
+pool = SQLitePool(DB_PATH)
+
+# Paginated tools: columns the model may ask for, and page size limits
+USER_COLUMNS = ("id", "name")
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# query tool: read-only SELECTs, refused if they scan a table bigger than SQLITE_MCP_MAX_SCAN_ROWS
+query_guard = QueryGuard(pool,
+                         max_scan_rows=int(os.environ.get("SQLITE_MCP_MAX_SCAN_ROWS", "10000")),
+                         max_rows=int(os.environ.get("SQLITE_MCP_MAX_ROWS", "200")),
+                         max_bytes=int(os.environ.get("SQLITE_MCP_MAX_BYTES", "16000")))
+
 async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL
-            )
-        """)
-        await db.commit()
+    await pool.open()
+    await pool.execute_write("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL
+        )
+    """)
+    # Serves the name filters and their (name, id) keyset order; id is the rowid, so it is part of the index
+    await pool.execute_write("CREATE INDEX IF NOT EXISTS idx_users_name ON users (name)")
 
 @mcp.tool()
 async def list_users() -> list[dict]:
-    """List all users from my app users"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("SELECT id, name FROM users")
-        rows = await cur.fetchall()
-        await cur.close()
+    """List all users from my app users (for large tables use list_users_page)"""
+    rows = await pool.fetchall("SELECT id, name FROM users")
     return [{"id": r[0], "name": r[1]} for r in rows]
 
+def _encode_cursor(key, filters):
+    payload = json.dumps({"k": key, "f": filters}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor, filters):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key = payload["k"]
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor, start again without one")
+    # A cursor is only valid for the filters it was created with
+    if payload.get("f") != filters:
+        raise ValueError("The cursor was created with different filters, start again without one")
+    return key
+
+@mcp.tool()
+async def list_users_page(cursor: Optional[str] = None, page_size: int = DEFAULT_PAGE_SIZE,
+                          columns: Optional[list[str]] = None, name: Optional[str] = None,
+                          name_prefix: Optional[str] = None) -> dict:
+    """
+    List users one page at a time. Pass the returned next_cursor to get the next page; it is null on the last page.
+    Optional: columns to return (id, name), an exact name filter, or a name_prefix filter.
+    Keep the same filters while paging.
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    columns = list(columns or USER_COLUMNS)
+    unknown = [c for c in columns if c not in USER_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}, available: {list(USER_COLUMNS)}")
+    filters = {"name": name, "name_prefix": name_prefix}
+
+    # Keyset pagination: "after the last key" is an index seek, so every page costs the same
+    # whatever its position (no OFFSET scanning and discarding the previous rows)
+    where, params = [], []
+    if name is not None:
+        where.append("name = ?")
+        params.append(name)
+    if name_prefix:
+        # Range instead of LIKE so the index on name is used
+        where.append("name >= ? AND name < ?")
+        params += [name_prefix, name_prefix + "\U0010ffff"]
+        order = ("name", "id")
+    else:
+        order = ("id",)
+    if cursor:
+        key = _decode_cursor(cursor, filters)
+        if len(key) != len(order):
+            raise ValueError("Invalid cursor, start again without one")
+        where.append(f"({', '.join(order)}) > ({', '.join('?' * len(order))})")
+        params += key
+        if len(order) > 1:
+            # SQLite doesn't seek on a row-value comparison: bound the leading column too
+            where.append(f"{order[0]} >= ?")
+            params.append(key[0])
+
+    select = list(dict.fromkeys(list(order) + columns))
+    sql = (f"SELECT {', '.join(select)} FROM users"
+           f"{' WHERE ' + ' AND '.join(where) if where else ''}"
+           f" ORDER BY {', '.join(order)} LIMIT ?")
+    # One extra row tells whether there is a next page
+    params.append(page_size + 1)
+
+    rows = []
+    async with contextlib.aclosing(pool.iterate(sql, params)) as results:
+        async for row in results:
+            rows.append(dict(zip(select, row)))
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    next_cursor = _encode_cursor([rows[-1][c] for c in order], filters) if has_more else None
+    return {"rows": [{c: row[c] for c in columns} for row in rows], "next_cursor": next_cursor}
+
+@mcp.tool()
+async def query(sql: str, params: Optional[list] = None) -> dict:
+    """
+    Run one read-only SQLite SELECT and return its columns and rows. Use ? placeholders and pass the values in params.
+    Filter, aggregate (COUNT, SUM, GROUP BY...) and sort in the SQL instead of fetching whole tables.
+    Table: users(id INTEGER PRIMARY KEY, name TEXT, indexed).
+    Writes are rejected, results are capped (truncated=true), and queries that would scan a large table
+    without using an index are refused.
+    """
+    return await query_guard.run(sql, params or [])
+
 @mcp.tool()
 async def add_user(name: str) -> str:
     """Add a new user in the app users table"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT INTO users (name) VALUES (?)", (name,))
-        await db.commit()
+    # Concurrent inserts from several agents are committed together in one transaction
+    await pool.execute_write("INSERT INTO users (name) VALUES (?)", (name,))
     return f"User {name} added."
 
+async def main():
+    # The pool must live on the same event loop as the server
+    await init_db()
+    try:
+        await mcp.run_stdio_async()
+    finally:
+        await pool.close()
+
 if __name__ == "__main__":
-    asyncio.run(init_db())
-    asyncio.run(mcp.run_stdio_async())
+    asyncio.run(main())
@@ -0,0 +1,175 @@
+"""
+Long-lived, pooled aiosqlite connections for the SQLite MCP server.
+
+Opening a connection for every tool call (and committing, i.e. fsyncing, every insert on its
+own) dominates tool latency when many agents share the server. This module keeps:
+  - N reader connections in WAL journal mode, so reads never block on the writer and run in
+    parallel. Long-lived connections also keep sqlite3's prepared-statement cache warm
+    (cached_statements), so repeated tool statements are not parsed again.
+  - One writer connection fed by a queue. The writer drains all writes that are waiting, runs
+    them in one transaction (each one in its own SAVEPOINT, so a failing statement doesn't
+    affect the others), and commits once: concurrent inserts share a single fsync (group commit).
+
+Usage:
+    pool = SQLitePool("demo.db")
+    await pool.open()
+    rows = await pool.fetchall("SELECT id, name FROM users")
+    user_id = await pool.execute_write("INSERT INTO users (name) VALUES (?)", ("Ana",))
+"""
+import asyncio
+import contextlib
+import logging
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+
+class SQLitePool:
+    """
+    Args:
+        path: SQLite database file.
+        readers: Number of reader connections.
+        max_batch: Maximum writes committed in one transaction.
+        max_batch_delay: Seconds the writer waits for more writes before committing a batch
+            (0 = commit whatever is queued right away).
+        busy_timeout_ms: How long a connection waits for a lock before failing.
+        cached_statements: Size of each connection's prepared-statement cache.
+    """
+
+    def __init__(self, path, readers=4, max_batch=256, max_batch_delay=0.0, busy_timeout_ms=5000,
+                 cached_statements=256):
+        self.path = path
+        self.readers = readers
+        self.max_batch = max_batch
+        self.max_batch_delay = max_batch_delay
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._reader_queue = None
+        self._reader_connections = []
+        self._writer = None
+        self._write_queue = None
+        self._writer_task = None
+        self._open_lock = asyncio.Lock()
+        self.batches = 0
+        self.writes = 0
+
+    async def _connect(self, read_only=False):
+        # isolation_level=None: no implicit transactions, the writer issues BEGIN/COMMIT itself
+        db = await aiosqlite.connect(self.path, isolation_level=None, cached_statements=self.cached_statements)
+        await db.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        await db.execute("PRAGMA journal_mode=WAL")
+        # With WAL, NORMAL only fsyncs at checkpoints; a commit survives an app crash (not a power loss)
+        await db.execute("PRAGMA synchronous=NORMAL")
+        if read_only:
+            # Readers may run statements written by a model: any write on them fails
+            await db.execute("PRAGMA query_only=ON")
+        return db
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    async def open(self):
+        """Open the connections and start the writer (idempotent)"""
+        async with self._open_lock:
+            if self.is_open:
+                return
+            self._writer = await self._connect()
+            self._reader_queue = asyncio.Queue()
+            for _ in range(self.readers):
+                db = await self._connect(read_only=True)
+                self._reader_connections.append(db)
+                self._reader_queue.put_nowait(db)
+            self._write_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._write_loop())
+            logger.info(f"SQLite pool open: {self.path} ({self.readers} readers, 1 writer, WAL)")
+
+    @contextlib.asynccontextmanager
+    async def reader(self):
+        """Borrow a reader connection"""
+        db = await self._reader_queue.get()
+        try:
+            yield db
+        finally:
+            self._reader_queue.put_nowait(db)
+
+    async def fetchall(self, sql, params=()):
+        async with self.reader() as db:
+            async with db.execute(sql, params) as cursor:
+                return await cursor.fetchall()
+
+    async def iterate(self, sql, params=(), arraysize=64):
+        """
+        Yield the rows of a query as SQLite steps through them, arraysize rows per round trip to
+        the connection thread, instead of materializing the whole result. The reader connection
+        is held until the iteration ends.
+        """
+        async with self.reader() as db:
+            async with db.execute(sql, params) as cursor:
+                while rows := await cursor.fetchmany(arraysize):
+                    for row in rows:
+                        yield row
+
+    async def execute_write(self, sql, params=()):
+        """
+        Queue a write and wait until its transaction is committed.
+
+        Returns:
+            The statement's lastrowid (e.g. the ID of an inserted row).
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._write_queue.put((sql, params, future))
+        return await future
+
+    async def _write_loop(self):
+        while True:
+            batch = [await self._write_queue.get()]
+            if self.max_batch_delay:
+                await asyncio.sleep(self.max_batch_delay)
+            while len(batch) < self.max_batch and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch):
+        results = []
+        try:
+            await self._writer.execute("BEGIN IMMEDIATE")
+            for sql, params, _ in batch:
+                # One savepoint per statement: a failing write is rolled back alone
+                await self._writer.execute("SAVEPOINT write")
+                try:
+                    async with self._writer.execute(sql, params) as cursor:
+                        results.append((cursor.lastrowid, None))
+                    await self._writer.execute("RELEASE write")
+                except Exception as e:
+                    await self._writer.execute("ROLLBACK TO write")
+                    await self._writer.execute("RELEASE write")
+                    results.append((None, e))
+            await self._writer.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Write batch of {len(batch)} failed: {e}")
+            with contextlib.suppress(Exception):
+                await self._writer.execute("ROLLBACK")
+            results = [(None, e)] * len(batch)
+
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, _, future), (result, error) in zip(batch, results):
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        if not self.is_open:
+            return
+        self._writer_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._writer_task
+        for db in self._reader_connections + [self._writer]:
+            await db.close()
+        self._reader_connections = []
+        self._writer = None
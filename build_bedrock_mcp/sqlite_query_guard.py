@@ -0,0 +1,203 @@
+"""
+Read-only, cost-guarded SQL queries for the SQLite MCP server's query tool.
+
+A model can write any SQL, so QueryGuard.run:
+  - Prepares the statement on a pooled reader with an authorizer that only allows reading
+    (SELECT, column reads, functions, recursive CTEs). Writes, PRAGMA, ATTACH, etc. are refused
+    when the statement is prepared, before it runs. The readers are also PRAGMA query_only.
+  - Runs EXPLAIN QUERY PLAN first, and refuses plans that would scan every row of a table larger
+    than max_scan_rows. The error names the indexed columns, so the model can add a filter.
+  - Gives every query a budget of max_vm_steps SQLite VM instructions and timeout_seconds of
+    wall-clock time, and interrupts it past either one (e.g. an unbounded recursive CTE, which
+    no plan check can catch), so a query can't keep a pooled reader forever.
+  - Streams the rows and stops at max_rows or max_bytes (JSON size), so the response stays small.
+  - Caches results of repeated queries (same SQL and parameters) until the next write through
+    the pool, or ttl_seconds for writes made by other processes.
+
+Usage:
+    guard = QueryGuard(pool, max_scan_rows=10000)
+    result = await guard.run("SELECT name, COUNT(*) FROM users WHERE name >= ? GROUP BY name", ["A"])
+"""
+import asyncio
+import collections
+import contextlib
+import json
+import logging
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+# Instructions between two progress handler calls
+_PROGRESS_STEPS = 1000
+_SCALAR_TYPES = (str, int, float, bytes, type(None))
+# "SCAN users", "SCAN users USING COVERING INDEX idx" (full index scan) or "SCAN u" (alias).
+# "SCAN CONSTANT ROW", CTEs ("SCAN t") and subqueries ("SCAN (subquery-1)") are not tables.
+_SCAN = re.compile(r"^SCAN (\S+)")
+# "FROM users u", "JOIN users AS u", "FROM orders o, users u": alias -> table
+_ALIAS = re.compile(r'(?:\bFROM|\bJOIN|,)\s+"?(\w+)"?\s+(?:AS\s+)?(?!(?:WHERE|JOIN|INNER|LEFT|RIGHT|FULL|CROSS|'
+                    r'NATURAL|ON|USING|GROUP|ORDER|LIMIT|HAVING|WINDOW|UNION|EXCEPT|INTERSECT|INDEXED|NOT)\b)(\w+)',
+                    re.IGNORECASE)
+
+
+class QueryRefused(ValueError):
+    """The statement is not read-only or is too expensive"""
+
+
+def _read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    return sqlite3.SQLITE_OK if action in _READ_ACTIONS else sqlite3.SQLITE_DENY
+
+
+class QueryGuard:
+    """
+    Args:
+        pool: SQLitePool the queries run on.
+        max_scan_rows: Largest table a query may scan completely.
+        max_rows: Maximum rows returned.
+        max_bytes: Maximum size of the returned rows (as JSON).
+        cache_size: Results kept in the LRU cache (0 disables it).
+        ttl_seconds: Maximum age of a cached result, and of the table statistics.
+        max_vm_steps: SQLite VM instructions a query may run before it is interrupted.
+        timeout_seconds: Wall-clock time a query may run before it is interrupted.
+    """
+
+    def __init__(self, pool, max_scan_rows=10000, max_rows=200, max_bytes=16000, cache_size=128, ttl_seconds=30,
+                 max_vm_steps=20_000_000, timeout_seconds=5.0):
+        self.pool = pool
+        self.max_vm_steps = max_vm_steps
+        self.timeout_seconds = timeout_seconds
+        self.max_scan_rows = max_scan_rows
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+        self.ttl_seconds = ttl_seconds
+        self._cache = collections.OrderedDict()
+        self._stats = None
+        self._stats_time = 0.0
+
+    async def _row_estimate(self, table, analyzed):
+        # COUNT(*) reads the whole table; ANALYZE statistics or max(rowid) (one b-tree seek) are enough
+        if table in analyzed:
+            return analyzed[table]
+        try:
+            # Table names come from sqlite_master, not from the model
+            (count,) = (await self.pool.fetchall(f'SELECT max(rowid) FROM "{table}"'))[0]
+        except sqlite3.OperationalError:
+            # WITHOUT ROWID table never analyzed: only the VM budget applies to it
+            return 0
+        return count or 0
+
+    async def table_stats(self):
+        """{table: (estimated row count, indexed columns)}, refreshed every ttl_seconds"""
+        if self._stats is None or time.monotonic() - self._stats_time > self.ttl_seconds:
+            stats, analyzed = {}, {}
+            has_stat1 = await self.pool.fetchall(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if has_stat1:
+                # The first number of stat is the table's row count when ANALYZE ran
+                for table, stat in await self.pool.fetchall("SELECT tbl, stat FROM sqlite_stat1"):
+                    with contextlib.suppress(ValueError, AttributeError):
+                        analyzed[table] = max(analyzed.get(table, 0), int(stat.split()[0]))
+            tables = await self.pool.fetchall(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+            for (table,) in tables:
+                count = await self._row_estimate(table, analyzed)
+                indexed = await self.pool.fetchall(
+                    "SELECT DISTINCT ii.name FROM pragma_index_list(?) il, pragma_index_info(il.name) ii "
+                    "WHERE ii.name IS NOT NULL", (table,))
+                columns = await self.pool.fetchall("SELECT name FROM pragma_table_info(?) WHERE pk > 0", (table,))
+                stats[table] = (count, sorted({row[0] for row in indexed + columns}))
+            self._stats, self._stats_time = stats, time.monotonic()
+        return self._stats
+
+    def _check_plan(self, sql, plan, stats):
+        aliases = {alias: table for table, alias in _ALIAS.findall(sql) if table in stats}
+        for row in plan:
+            match = _SCAN.match(row[-1])
+            if not match or row[-1].startswith("SCAN CONSTANT ROW"):
+                continue
+            name = match.group(1)
+            # The plan names a table or its alias; other names are CTEs or subqueries, whose own
+            # table accesses are separate rows of the plan
+            table = name if name in stats else aliases.get(name)
+            if table is None:
+                continue
+            count, indexed = stats[table]
+            if count > self.max_scan_rows:
+                hint = f"filter on an indexed column ({', '.join(indexed)})" if indexed else "add a WHERE filter"
+                raise QueryRefused(f"Query refused: it would scan about {count} rows of {table} "
+                                   f"(limit {self.max_scan_rows}); {hint}")
+
+    async def run(self, sql, params=()):
+        """
+        Returns:
+            {"columns": [...], "rows": [[...], ...], "row_count": n, "truncated": bool}
+        """
+        if not isinstance(params, (list, tuple)) and params is not None:
+            raise QueryRefused("params must be a list of values for the ? placeholders")
+        params = tuple(params or ())
+        if not all(isinstance(value, _SCALAR_TYPES) for value in params):
+            raise QueryRefused("params must be scalar values (text, numbers or null), one per ? placeholder")
+        key = (sql.strip(), params)
+        cached = self._cache.get(key)
+        if cached and cached[0] == self.pool.writes and time.monotonic() - cached[1] <= self.ttl_seconds:
+            self._cache.move_to_end(key)
+            return cached[2]
+
+        version = self.pool.writes
+        stats = await self.table_stats()
+        async with self.pool.reader() as db:
+            deadline = time.monotonic() + self.timeout_seconds
+            steps = [0]
+
+            def progress():
+                # Runs on the connection's thread; a non-zero return aborts the statement
+                steps[0] += _PROGRESS_STEPS
+                return steps[0] > self.max_vm_steps or time.monotonic() > deadline
+
+            await db.set_authorizer(_read_only_authorizer)
+            await db.set_progress_handler(progress, _PROGRESS_STEPS)
+            # Backstop for time spent outside the VM; interrupt() doesn't wait behind the running statement
+            loop = asyncio.get_running_loop()
+            watchdog = loop.call_later(self.timeout_seconds, lambda: loop.create_task(db.interrupt()))
+            try:
+                try:
+                    plan = await db.execute_fetchall(f"EXPLAIN QUERY PLAN {sql}", params)
+                    self._check_plan(sql, plan, stats)
+                    result = await self._fetch(db, sql, params)
+                except sqlite3.DatabaseError as e:
+                    if "not authorized" in str(e):
+                        raise QueryRefused("Only read-only SELECT statements are allowed") from e
+                    if "interrupted" in str(e):
+                        raise QueryRefused(f"Query refused: it exceeded its budget ({self.max_vm_steps} steps or "
+                                           f"{self.timeout_seconds} s); add filters or a LIMIT") from e
+                    raise
+            finally:
+                watchdog.cancel()
+                await db.set_progress_handler(None, 0)
+                await db.set_authorizer(None)
+
+        if self.cache_size:
+            self._cache[key] = (version, time.monotonic(), result)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    async def _fetch(self, db, sql, params):
+        rows, size, truncated = [], 0, False
+        async with db.execute(sql, params) as cursor:
+            columns = [column[0] for column in cursor.description]
+            # Rows are fetched in small batches and the cursor is abandoned at the cap
+            while not truncated and (batch := await cursor.fetchmany(64)):
+                for row in batch:
+                    row_size = len(json.dumps(row, default=str))
+                    if len(rows) >= self.max_rows or size + row_size > self.max_bytes:
+                        truncated = True
+                        break
+                    rows.append(list(row))
+                    size += row_size
+        if truncated:
+            logger.info(f"Query truncated at {len(rows)} rows / {size} bytes")
+        return {"columns": columns, "rows": rows, "row_count": len(rows), "truncated": truncated}
@@ -1,9 +1,13 @@
-import boto3
 import json
+import os
+import sys
+
+# Make the repository-level bedrock_shared package importable when running from this folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from bedrock_shared import get_bedrock_runtime_client, EmbeddingEngine
 
 # Init the Bedrock client, and passing in the CLI profile
-session = boto3.Session(profile_name="default")
-bedrock_runtime = session.client(service_name='bedrock-runtime', region_name="us-west-2")
+bedrock_runtime = get_bedrock_runtime_client(region_name="us-west-2", profile_name="default")
 
 # Prompt
 prompt_data = "Un hombre cambia la rueda de su bicicleta, después de un pinchazo"
@@ -23,3 +27,24 @@ response_body = json.loads(response.get("body").read())
 # Show the Embedding Vector
 embedding = response_body.get("embedding")
 print(f"El embedding vector tiene {len(embedding)} elementos\n{embedding[0:3]+['...']+embedding[-3:]}")
+
+
+# Many texts at once: the EmbeddingEngine dedupes them, reuses cached vectors (on disk, by content hash),
+# calls Bedrock concurrently under a rate limit, and returns a float32 NumPy matrix (one row per text)
+engine = EmbeddingEngine(model_id=modelId,
+                         client=bedrock_runtime,
+                         cache_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings.sqlite"),
+                         max_workers=8,
+                         requests_per_second=10)
+textos = [
+    prompt_data,
+    "Una mujer repara el pinchazo de su bicicleta",
+    "El mercado de valores cerró al alza",
+    prompt_data,  # repetido: se embebe una sola vez
+]
+matriz = engine.embed(textos)
+print(f"\nMatriz de embeddings: shape={matriz.shape}, dtype={matriz.dtype}, llamadas a Bedrock={engine.calls}, cache hits={engine.cache_hits}")
+
+# Con vectores normalizados, la similitud coseno es el producto escalar
+print(f"Similitud texto 0 vs 1: {matriz[0] @ matriz[1]:.3f}")
+print(f"Similitud texto 0 vs 2: {matriz[0] @ matriz[2]:.3f}")
@@ -0,0 +1,193 @@
+# %%
+"""
+Cache of Athena query results for the NL->SQL tool loop.
+
+The model often generates the same SQL again for a repeated (or rephrased) question, and every
+Athena query costs seconds of queueing and scanning plus the per-TB scan price. Results are
+cached by (database, normalized SQL):
+  - Normalization collapses whitespace and comments, lowercases keywords and identifiers,
+    and canonicalizes literals (string quoting, numbers, DATE('x') vs DATE 'x'). String literals
+    keep their case, since Athena comparisons on them are case-sensitive.
+  - Entries live in memory and as Parquet files on disk, so they survive kernel restarts.
+  - Entries expire after ttl_seconds; the oldest files are evicted beyond max_entries.
+
+Only read-only statements (SELECT / WITH / SHOW / DESCRIBE) are cached.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.cache', 'athena_results')
+
+_SQL_TOKEN = re.compile(r"""
+    (?P<string>'(?:[^']|'')*')          # 'string literal' ('' escapes a quote)
+  | (?P<identifier>"(?:[^"]|"")*")      # "quoted identifier"
+  | (?P<number>\d+\.\d*|\.\d+|\d+)      # numeric literal
+  | (?P<word>[A-Za-z_][A-Za-z0-9_]*)    # keyword or identifier
+  | (?P<operator><>|!=|<=|>=|\|\||\S)   # operators and punctuation
+""", re.VERBOSE)
+_COMMENTS = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_READ_ONLY = ('select', 'with', 'show', 'describe', 'values')
+_TYPED_LITERALS = ('date', 'timestamp', 'time')
+
+
+def _canonical_number(text):
+    if '.' not in text:
+        return str(int(text))
+    integer, _, fraction = text.partition('.')
+    return f"{int(integer or 0)}.{fraction.rstrip('0') or '0'}"
+
+
+def normalize_sql(sql):
+    """
+    Canonical form of a SQL statement, used as the cache key.
+
+    >>> normalize_sql("SELECT sum(money)\\nFROM coffee_shop_sales WHERE \\"date\\" = DATE('2024-03-01');")
+    "select sum ( money ) from coffee_shop_sales where date = date '2024-03-01'"
+    """
+    tokens = []
+    for match in _SQL_TOKEN.finditer(_COMMENTS.sub(' ', sql)):
+        kind, text = match.lastgroup, match.group()
+        if kind == 'word':
+            tokens.append(text.lower())
+        elif kind == 'identifier':
+            # Athena identifiers are case-insensitive; quotes only matter for reserved words/special chars
+            name = text[1:-1].replace('""', '"').lower()
+            tokens.append(name if re.fullmatch(r"[a-z_][a-z0-9_]*", name) else f'"{name}"')
+        elif kind == 'number':
+            tokens.append(_canonical_number(text))
+        else:
+            tokens.append(text)
+
+    # DATE('2024-03-01') and DATE '2024-03-01' are the same literal
+    canonical = []
+    i = 0
+    while i < len(tokens):
+        if (tokens[i] in _TYPED_LITERALS and tokens[i + 1:i + 2] == ['('] and tokens[i + 3:i + 4] == [')']
+                and tokens[i + 2].startswith("'")):
+            canonical += [tokens[i], tokens[i + 2]]
+            i += 4
+        else:
+            canonical.append(tokens[i])
+            i += 1
+    while canonical and canonical[-1] == ';':
+        canonical.pop()
+    return ' '.join(canonical)
+
+
+def is_read_only(sql):
+    normalized = normalize_sql(sql)
+    return normalized.split(' ', 1)[0] in _READ_ONLY if normalized else False
+
+
+class AthenaResultCache:
+    """
+    In-memory + Parquet cache of query results (pandas DataFrames).
+
+    Args:
+        cache_dir: Folder for the Parquet files; None keeps the cache in memory only.
+        ttl_seconds: Time an entry stays valid.
+        max_entries: Maximum number of Parquet files kept on disk (oldest are evicted first).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=900, max_entries=500):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._memory = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def make_key(self, sql, db_name):
+        key = json.dumps([db_name, normalize_sql(sql)])
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def get(self, sql, db_name):
+        """Return a copy of the cached DataFrame, or None"""
+        key = self.make_key(sql, db_name)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1].copy()
+            self._memory.pop(key, None)
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                expires_at = os.path.getmtime(path) + self.ttl_seconds
+                if expires_at > now:
+                    df = pd.read_parquet(path)
+                    with self._lock:
+                        self._memory[key] = (expires_at, df)
+                        self.hits += 1
+                    return df.copy()
+                os.remove(path)
+            except (OSError, ValueError):
+                pass
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, sql, db_name, df):
+        key = self.make_key(sql, db_name)
+        with self._lock:
+            self._memory[key] = (time.time() + self.ttl_seconds, df.copy())
+        if self.cache_dir:
+            tmp_path = f"{self._path(key)}.tmp-{os.getpid()}-{threading.get_ident()}"
+            try:
+                df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, self._path(key))
+            except (ImportError, ValueError, TypeError) as e:
+                # e.g. no pyarrow, or columns Parquet can't store: keep the entry in memory only
+                print(f"Athena result not persisted to Parquet: {e}")
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        with self._lock:
+            self._memory = {key: entry for key, entry in self._memory.items() if entry[0] > now}
+        files = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.parquet')]
+        files.sort(key=os.path.getmtime, reverse=True)
+        for i, path in enumerate(files):
+            if i >= self.max_entries or os.path.getmtime(path) + self.ttl_seconds <= now:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith('.parquet'):
+                    os.remove(os.path.join(self.cache_dir, name))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_athena_cache(cache_dir=DEFAULT_CACHE_DIR, **kwargs):
+    """Return the process-wide AthenaResultCache for a folder (kwargs only apply on first creation)"""
+    with _caches_lock:
+        cache = _caches.get(cache_dir)
+        if cache is None:
+            cache = _caches[cache_dir] = AthenaResultCache(cache_dir, **kwargs)
+    return cache
@@ -1,9 +1,21 @@
 # %%
 import awswrangler as wr
-import boto3
+import os
+import sys
 import textwrap
+import threading
 from loguru import logger
 
+# Make the repository-level bedrock_shared package importable from the notebooks folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from bedrock_shared import get_bedrock_runtime_client, cached_converse
+
+# Sibling modules of this file (e.g. athena_cache), whether imported as utils.bedrock_utils or run directly
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from athena_cache import is_read_only
+from result_serializer import serialize_dataframe
+from tool_engine import ToolRegistry, run_tool_loop
+
 # %%
 ##############################################################################
 # SQL PROMPTS
@@ -89,6 +101,7 @@ tools_instructions = """
     Input: {"sql_query": "your SQL query here"}
     
     Never return the SQL query directly - always use the run_query tool to execute it.
+    If you need several queries, request all the run_query calls in the same response: they run in parallel.
     """
 
 # %%
@@ -132,7 +145,9 @@ toolConfig = {
 ##############################################################################
 
 def run_query(query: str, 
-              db_name: str = "db_coffee_shop_sales") -> None:
+              db_name: str = "db_coffee_shop_sales",
+              result_cache=None,
+              athena_reuse_seconds: int = 0) -> None:
     """
     Generic function to run athena query and ensures it is successfully completed
 
@@ -140,8 +155,13 @@ def run_query(query: str,
     ----------
     query : str
         formatted string containing athena sql query
-    results : str
-        query output path
+    db_name : str
+        Glue/Athena database
+    result_cache : AthenaResultCache, optional
+        e.g. athena_cache.get_athena_cache(); identical (normalized) read-only queries
+        are answered from memory / local Parquet files without running them
+    athena_reuse_seconds : int, optional
+        if > 0, let awswrangler reuse the S3 results of a matching query run in the last N seconds
     
     Returns pandas dataframe
     """
@@ -150,30 +170,85 @@ def run_query(query: str,
     print(f"\n{'='*50}\nSQL Statement\n{'='*50}")
     print(query)
 
+    cacheable = result_cache is not None and is_read_only(query)
+    if cacheable:
+        cached = result_cache.get(query, db_name)
+        if cached is not None:
+            print("Result served from the local Athena result cache (query not run)")
+            return cached
+
+    # awswrangler can skip the query by reusing a past execution's results from Athena's query history
+    cache_kwargs = {}
+    if athena_reuse_seconds:
+        cache_kwargs['athena_cache_settings'] = {'max_cache_seconds': athena_reuse_seconds}
+
     # Run query
     response = wr.athena.read_sql_query(query,
                                         database=db_name,
-                                        ctas_approach=False)
+                                        ctas_approach=False,
+                                        **cache_kwargs)
+
+    if cacheable:
+        result_cache.put(query, db_name, response)
     
     return response
 
 
 # %%
-def process_tool_call(tool_name, tool_input):
+def run_query_tool(tool_input, result_cache=None, athena_reuse_seconds=0,
+                   result_format="csv", max_result_rows=50, max_result_bytes=4000):
+    """
+    Handler of the run_query tool: runs the SQL and serializes the result for the model.
+
+    Args:
+        tool_input (dict): {"sql_query": ...} from the toolUse block.
+        result_cache (AthenaResultCache, optional): local cache of query results (see run_query).
+        athena_reuse_seconds (int, optional): reuse Athena results of matching queries (see run_query).
+        result_format (str, optional): "csv" or "jsonl" (see result_serializer.serialize_dataframe).
+        max_result_rows (int, optional): rows sent back to the model; the rest is summarized.
+        max_result_bytes (int, optional): size cap of the tool result.
+
+    Returns:
+        str: the serialized query result.
+    """
+    df = run_query(tool_input['sql_query'],
+                   result_cache=result_cache,
+                   athena_reuse_seconds=athena_reuse_seconds)
+    # Compact, typed and size-capped instead of str(df), so the follow-up converse call stays small
+    return serialize_dataframe(df, fmt=result_format, max_rows=max_result_rows, max_bytes=max_result_bytes)
+
+
+def sql_tool_registry(**tool_options):
+    """ToolRegistry with run_query; tool_options are passed to run_query_tool (e.g. result_cache)"""
+    registry = ToolRegistry()
+    registry.register(get_tool_spec_sql, lambda tool_input: run_query_tool(tool_input, **tool_options))
+    return registry
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def process_tool_call(tool_name, tool_input, **tool_options):
     """_summary_
 
     Args:
         tool_name (_type_): _description_
         tool_input (_type_): _description_
+        tool_options: passed to the tool handler (see run_query_tool).
 
     Returns:
         _type_: _description_
     """
-    if tool_name == "run_query":
-        # Pending to filter here for Lambda arguments
-        print("calling run_query tool")
-        
-        return str(run_query(tool_input['sql_query']))
+    # One registry per set of options, built on first use instead of on every tool call
+    key = tuple(sorted(tool_options.items()))
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = sql_tool_registry(**tool_options)
+    if tool_name in registry:
+        print(f"calling {tool_name} tool")
+        return registry.call(tool_name, tool_input)
     
     else:
         logger.error(f"Tool {tool_name} not implemented")
@@ -186,7 +261,8 @@ def generate_conversation(bedrock_client,
                           system_prompts,
                           messages,
                           tool_config={},
-                          show_token_usage=False):
+                          show_token_usage=False,
+                          response_cache=None):
     """
     Sends messages to a model.
     Args:
@@ -195,6 +271,8 @@ def generate_conversation(bedrock_client,
         system_prompts (JSON) : The system prompts for the model to use.
         messages (JSON) : The messages to send to the model.
         tool_config (JSON) : The tool_config containing tool specs
+        response_cache (ResponseCache, optional) : bedrock_shared.ResponseCache to answer repeated requests
+                                                   without calling the model.
 
     Returns:
         response (JSON): The conversation that the model generated.
@@ -211,10 +289,15 @@ def generate_conversation(bedrock_client,
     # Additional inference parameters to use.
     additional_model_fields = {"top_k": top_k}
 
-    # Send the message.
+    # Send the message (through the response cache, if any).
+    def converse(**kwargs):
+        if response_cache is not None:
+            return cached_converse(bedrock_client, response_cache, **kwargs)
+        return bedrock_client.converse(**kwargs)
+
     if tool_config == {}:
         print("No tools used in this conversation")
-        response = bedrock_client.converse(
+        response = converse(
             modelId=model_id,
             messages=messages,
             system=system_prompts,
@@ -223,7 +306,7 @@ def generate_conversation(bedrock_client,
         )
     else:
         print(f"Calling Conversational API with tools")
-        response = bedrock_client.converse(
+        response = converse(
             modelId=model_id,
             messages=messages,
             system=system_prompts,
@@ -232,6 +315,9 @@ def generate_conversation(bedrock_client,
             additionalModelRequestFields=additional_model_fields
         )
 
+    if response.get('cacheHit'):
+        print("Response served from cache (no model call)")
+
     # Log token usage.
     if show_token_usage:
         token_usage = response['usage']
@@ -243,139 +329,118 @@ def generate_conversation(bedrock_client,
 
     return response
 
-# %%
-def append_tool_result(user_query, message, tool_use, tool_result):
-    """_summary_
-
-    Args:
-        user_query (_type_): _description_
-        message (_type_): _description_
-        tool_use (_type_): _description_
-        tool_result (_type_): _description_
-
-    Returns:
-        _type_: _description_
-    """
-    messages = [
-                {"role": "user", "content": [{"text": user_query}]},
-                {"role": "assistant", "content": message['content']},
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "toolResult": {
-                                "toolUseId": tool_use['toolUseId'],
-                                "content": [{"text": tool_result}],
-                            }
-                        }
-                    ],
-                },
-            ]
-    return messages
-
 # %%
 def chat_with_claude_nl_to_sql(messages,
-                               toolConfig=toolConfig,
+                               toolConfig=None,
                                system_prompts=[{"text": BASE_PROMPT_TEMPLATE_SQL}],
-                               model_id = "anthropic.claude-3-5-haiku-20241022-v1:0"):
+                               model_id = "anthropic.claude-3-5-haiku-20241022-v1:0",
+                               response_cache=None,
+                               result_cache=None,
+                               athena_reuse_seconds=0,
+                               tools=None,
+                               max_iterations=5,
+                               time_budget_seconds=120,
+                               max_parallel_tools=4,
+                               tool_timeout_seconds=60):
     """_summary_
 
     Args:
         messages (_type_): _description_
-        toolConfig (_type_): _description_
+        toolConfig (dict, optional): toolConfig sent to converse(). Defaults to None, i.e. the specs of the
+            tools in the registry (tools.tool_config()).
         system_prompts (list, optional): _description_. Defaults to [{"text": BASE_PROMPT_TEMPLATE_SQL}].
+        response_cache (ResponseCache, optional): e.g. bedrock_shared.get_response_cache('.cache/nl_to_sql.sqlite'),
+            so repeated questions skip the model round trips. Defaults to None (no cache).
+        result_cache (AthenaResultCache, optional): e.g. athena_cache.get_athena_cache(ttl_seconds=900),
+            so SQL the model generates again is answered without running it in Athena. Defaults to None.
+        athena_reuse_seconds (int, optional): reuse the results of matching Athena queries from the
+            last N seconds (awswrangler athena_cache_settings). Defaults to 0 (disabled).
+        tools (ToolRegistry, optional): tools the model can call. Defaults to run_query (sql_tool_registry).
+        max_iterations (int, optional): maximum model calls. Defaults to 5.
+        time_budget_seconds (int, optional): no new model call is started after this time. Defaults to 120.
+        max_parallel_tools (int, optional): tool calls of one turn running at the same time. Defaults to 4.
+        tool_timeout_seconds (int, optional): a tool call still running after this time is answered with
+            an error. Defaults to 60.
 
     Returns:
-        _type_: _description_
+        dict: "response" (final text), "messages" (full history), "iterations", "tool_calls", "stop_reason".
     """
-    # Bedrock settings
-    bedrock_client = boto3.client(service_name='bedrock-runtime')
+    # Bedrock settings: reuse the pooled client instead of building one per call
+    bedrock_client = get_bedrock_runtime_client()
+    registry = tools or sql_tool_registry(result_cache=result_cache, athena_reuse_seconds=athena_reuse_seconds)
+    # The model is offered exactly the tools the registry can dispatch
+    if toolConfig is None:
+        toolConfig = registry.tool_config()
     
-    # Get user question
+    # Get user question
     user_query = messages[0]['content'][0]['text']
     print(f"\n{'='*50}\nUser Message: {user_query}\n{'='*50}")
-    
-    # Send the message.
-    converse_response = generate_conversation(bedrock_client, model_id, system_prompts, messages, toolConfig)
 
-    # Log token usage.
-    token_usage = converse_response['usage']
-    print(f"\n{'='*50}\nToken Usage:\n{'='*50}")
-    print(f"Input tokens: {token_usage['inputTokens']}")
-    print(f"Output tokens: {token_usage['outputTokens']}")
-    print(f"Total tokens: {token_usage['totalTokens']}")
-    
-    message = converse_response['output']['message']
-    
-    print(f"\n{'='*50}\nStep by step thinking:\n{'='*50}")
-    print(f"\nInitial Response:")
-    print(f"Stop Reason: {converse_response['stopReason']}")
-    print(f"Content: {message['content'][0]['text']}")
-    
-    if converse_response['stopReason'] == "tool_use":
-        using_tool  = True
-    else:
-        using_tool  = False
-        
-    while using_tool:
-        if converse_response['stopReason'] == "tool_use":
-            tool_use = next(block['toolUse'] for block in message['content'] if block.get('toolUse'))
-            tool_name = tool_use["name"]
-            tool_input = tool_use["input"]
-    
-            # print(f"\nTool Used: {tool_name}")
-            # print(f"Tool Input: {tool_input}")
-    
-            tool_result = process_tool_call(tool_name, tool_input)
+    def converse(history):
+        return generate_conversation(bedrock_client, model_id, system_prompts, history, toolConfig,
+                                     response_cache=response_cache)
 
-            print(f"\n{'='*50}\nTool Result(SQL output):\n{'='*50}")
-            print(tool_result)
-            print("="*50)
-    
-            messages = append_tool_result(user_query, message, tool_use, tool_result)
-            converse_response = generate_conversation(bedrock_client, model_id, system_prompts, messages, toolConfig)
-
-            # Log token usage.
-            token_usage = converse_response['usage']
-            
-            print(f"\n{'='*50}\nTokens usage:\n{'='*50}")
-            print(f"Input tokens: {token_usage['inputTokens']}")
-            print(f"Output tokens: {token_usage['outputTokens']}")
-            print(f"Total tokens: {token_usage['totalTokens']}")
-            print(f"\n{'='*50}\n")
-    
-            message = converse_response['output']['message']
-        else:
-            response = message
-            
+    def log_response(response):
+        # Log token usage and the model's reasoning of each step
+        token_usage = response['usage']
+        print(f"\n{'='*50}\nToken Usage:\n{'='*50}")
+        print(f"Input tokens: {token_usage['inputTokens']}")
+        print(f"Output tokens: {token_usage['outputTokens']}")
+        print(f"Total tokens: {token_usage['totalTokens']}")
+        print(f"Stop Reason: {response['stopReason']}")
+        for block in response['output']['message']['content']:
+            if block.get('text'):
+                print(f"Content: {block['text']}")
+            elif block.get('toolUse'):
+                print(f"Tool call: {block['toolUse']['name']} {block['toolUse']['input']}")
+
+    # All the toolUse blocks of a turn run in parallel, and the full history is kept between turns
+    result = run_tool_loop(converse, messages, registry,
+                           max_iterations=max_iterations,
+                           time_budget_seconds=time_budget_seconds,
+                           max_workers=max_parallel_tools,
+                           on_response=log_response,
+                           tool_timeout_seconds=tool_timeout_seconds)
+
+    for message in result['messages'][len(messages):]:
         for block in message['content']:
-            if block.get('toolUse'):
-                using_tool = True
-                break
-            else:
-                using_tool = False
-    
+            if block.get('toolResult'):
+                print(f"\n{'='*50}\nTool Result(SQL output):\n{'='*50}")
+                print(block['toolResult']['content'][0]['text'])
+                print("="*50)
+
     final_response = next(
-        (block['text'] for block in message['content'] if block.get('text')),
+        (block['text'] for block in result['message']['content'] if block.get('text')),
         None,
     )
+    print(f"\nModel calls: {result['iterations']}, tool calls: {result['tool_calls']}, stop reason: {result['stop_reason']}")
 
     return {
-        "response": final_response
+        "response": final_response,
+        "messages": result['messages'],
+        "iterations": result['iterations'],
+        "tool_calls": result['tool_calls'],
+        "stop_reason": result['stop_reason'],
         }
 
 # %%
-def build_llm_query(questions, tools_instructions=None, examples=None):
+def build_llm_query(questions, tools_instructions=None, examples=None, prompt_builder=None):
     """_summary_
 
     Args:
         questions (_type_): _description_
         tools_instructions (_type_, optional): _description_. Defaults to None.
         examples (_type_, optional): _description_. Defaults to None.
+        prompt_builder (SqlPromptBuilder, optional): build a short message with the schema from the Glue
+            catalog and the most similar examples (use prompt_builder.system_prompts(tools_instructions)
+            as system_prompts). Defaults to None (hardcoded coffee_shop_sales templates).
 
     Returns:
         _type_: _description_
     """
+    if prompt_builder is not None:
+        return prompt_builder.build_messages(questions, tools_instructions)
+
     # use base prompt by default
     prompt_template = BASE_PROMPT_TEMPLATE_SQL
 
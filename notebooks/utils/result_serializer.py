@@ -0,0 +1,163 @@
+# %%
+"""
+Compact serialization of query results (pandas DataFrames) for tool results sent back to the model.
+
+str(df) pads columns with spaces, elides rows and columns depending on pandas display options,
+and says nothing about types. This serializer writes:
+  - A header with the row count and the column types.
+  - The rows, as CSV or as JSON lines (one JSON array per row).
+  - At most max_rows rows and max_bytes bytes, followed by an explicit truncation marker.
+  - For truncated results, an optional per-column summary (min/max/mean/sum, or top values),
+    so the model can still answer aggregate questions about the rows it did not see.
+
+The size of a tool result is therefore bounded and predictable.
+"""
+import csv
+import io
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_MAX_ROWS = 50
+DEFAULT_MAX_BYTES = 4000
+# Distinct values listed per text column in the summary of a truncated result
+SUMMARY_TOP_VALUES = 5
+
+
+def column_type(series):
+    """SQL-like type name of a pandas column"""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(dtype):
+        return 'bigint'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'double'
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'timestamp'
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    return {'date': 'date', 'datetime': 'timestamp', 'decimal': 'decimal', 'integer': 'bigint',
+            'floating': 'double', 'boolean': 'boolean', 'empty': 'unknown'}.get(inferred, 'string')
+
+
+def _format_value(value):
+    """Short text form of a cell; missing values are empty"""
+    if value is None or value is pd.NaT or (isinstance(value, (float, np.floating)) and math.isnan(value)):
+        return ''
+    if isinstance(value, (float, np.floating)):
+        return format(float(value), '.10g')
+    if isinstance(value, pd.Timestamp):
+        return value.date().isoformat() if value == value.normalize() else value.isoformat()
+    return str(value)
+
+
+def _json_value(value):
+    text = _format_value(value)
+    if text == '':
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, (float, np.floating)):
+        return float(text)
+    return text
+
+
+def _csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='').writerow(values)
+    return buffer.getvalue()
+
+
+def summarize(df, top_values=SUMMARY_TOP_VALUES):
+    """One summary line per column: numeric stats, date range, or the most frequent values"""
+    lines = []
+    for name in df.columns:
+        series = df[name].dropna()
+        kind = column_type(df[name])
+        if series.empty:
+            lines.append(f"{name}: all null")
+        elif kind in ('bigint', 'double', 'decimal'):
+            numbers = pd.to_numeric(series, errors='coerce').dropna()
+            lines.append(f"{name}: min={_format_value(float(numbers.min()))} max={_format_value(float(numbers.max()))} "
+                         f"mean={_format_value(float(numbers.mean()))} sum={_format_value(float(numbers.sum()))}")
+        elif kind in ('date', 'timestamp'):
+            lines.append(f"{name}: from {_format_value(series.min())} to {_format_value(series.max())}")
+        else:
+            counts = series.astype(str).value_counts()
+            top = ", ".join(f"{value}={count}" for value, count in counts.head(top_values).items())
+            more = f" (+{len(counts) - top_values} more)" if len(counts) > top_values else ""
+            lines.append(f"{name}: {len(counts)} distinct; top: {top}{more}")
+    return lines
+
+
+def serialize_dataframe(df, fmt='csv', max_rows=DEFAULT_MAX_ROWS, max_bytes=DEFAULT_MAX_BYTES, summarize_truncated=True):
+    """
+    Serialize a DataFrame for a tool result.
+
+    Args:
+        df: Query result.
+        fmt: 'csv' or 'jsonl'.
+        max_rows: Maximum number of rows written.
+        max_bytes: Approximate maximum size of the whole result, in UTF-8 bytes.
+        summarize_truncated: Append per-column statistics of the full result when rows are left out.
+
+    Returns:
+        The serialized result (str).
+    """
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"fmt must be 'csv' or 'jsonl', got {fmt!r}")
+
+    columns = [str(name) for name in df.columns]
+    types = [column_type(df[name]) for name in df.columns]
+    if fmt == 'csv':
+        header = [f"# rows={len(df)} columns={len(columns)}",
+                  "# types: " + ", ".join(f"{name}:{kind}" for name, kind in zip(columns, types)),
+                  _csv_line(columns)]
+    else:
+        header = [json.dumps({'rows': len(df), 'columns': [{'name': name, 'type': kind}
+                                                            for name, kind in zip(columns, types)]})]
+
+    def footer(shown):
+        if shown == len(df):
+            return []
+        if fmt == 'jsonl':
+            # One summary line per column, as in CSV: a size cut only drops the last columns' lines
+            return ([json.dumps({'truncated': True, 'shown': shown, 'total': len(df)})] +
+                    ([json.dumps({'summary': line}, ensure_ascii=False) for line in summarize(df)]
+                     if summarize_truncated else []))
+        return ([f"# truncated: showing {shown} of {len(df)} rows"] +
+                ([f"# summary {line}" for line in summarize(df)] if summarize_truncated else []))
+
+    budget = max_bytes - len("\n".join(header).encode('utf-8'))
+    lines = []
+    sizes = []
+    for row in df.head(max_rows).itertuples(index=False, name=None):
+        if fmt == 'csv':
+            line = _csv_line([_format_value(value) for value in row])
+        else:
+            line = json.dumps([_json_value(value) for value in row], ensure_ascii=False, default=str)
+        size = len(line.encode('utf-8')) + 1
+        if size > budget:
+            break
+        lines.append(line)
+        sizes.append(size)
+        budget -= size
+
+    # Rows were left out: make room for the truncation marker (and summary) by dropping rows
+    if len(lines) < len(df):
+        footer_size = len("\n".join(footer(len(lines))).encode('utf-8')) + 1
+        while lines and footer_size > budget:
+            lines.pop()
+            budget += sizes.pop()
+
+    result = "\n".join(header + lines + footer(len(lines)))
+    # Very wide results can still exceed the cap through the summary: cut it with a marker
+    encoded = result.encode('utf-8')
+    if len(encoded) > max_bytes:
+        marker = "# truncated: size limit" if fmt == 'csv' else json.dumps({'truncated': 'size limit'})
+        result = encoded[:max_bytes].decode('utf-8', errors='ignore').rsplit("\n", 1)[0] + "\n" + marker
+    return result
@@ -0,0 +1,203 @@
+# %%
+"""
+Schema-aware prompt builder for NL->SQL, with dynamic few-shot examples.
+
+BASE_PROMPT_TEMPLATE_SQL (bedrock_utils) has the coffee_shop_sales schema, its filter values and
+two examples written by hand, and the whole prompt is sent on every call. This builder:
+  - Reads the tables, columns and types from the Glue catalog, plus the values of low-cardinality
+    text columns (one SELECT DISTINCT per column), once. The result is saved as a JSON snapshot,
+    so later runs don't touch Glue or Athena.
+  - Renders the rules and the schema as a byte-stable system prompt (sorted, no timestamps), so
+    it can be reused by Bedrock prompt caching (optional cachePoint block).
+  - Puts only the examples most similar to the question (cosine similarity of Titan embeddings)
+    in the user message.
+
+Example:
+    schema = load_schema("db_coffee_shop_sales")
+    builder = SqlPromptBuilder(schema, ExampleSelector(DEFAULT_EXAMPLES))
+    chat_with_claude_nl_to_sql(builder.build_messages(question, tools_instructions),
+                               system_prompts=builder.system_prompts(tools_instructions))
+"""
+import json
+import os
+import sys
+
+import numpy as np
+
+# Make the repository-level bedrock_shared package importable from the notebooks folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from bedrock_shared import get_embedding_engine
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '.cache')
+# Text columns with at most this many distinct values get their values listed in the prompt
+MAX_DISTINCT_VALUES = 20
+_TEXT_TYPES = ('string', 'varchar', 'char')
+
+SQL_RULES = """You are an agent expert in building and running ANSI SQL statements, compatible with Amazon Athena or PrestoDB.
+Rules for the SQL statements:
+1. Avoid fetching all rows. If the user does not ask for an aggregation, fetch all columns with LIMIT 10.
+2. Use standard ANSI SQL aggregations (e.g. COUNT(*), GROUP BY). Do not use non-standard functions (e.g. RAND()).
+3. Use only the tables and columns of the schema below, without the database name.
+4. In WHERE filters on columns with listed values, use only those values, never invented ones.
+5. For DATE columns use DATE('YYYY-MM-DD') literals, or the Athena date_parse functions.
+6. Quote column names that are reserved words, e.g. "date"."""
+
+DEFAULT_EXAMPLES = [
+    {"question": "What is the total amount of money spent in the coffee shop between March 1st and March 4th, 2024?",
+     "sql": "SELECT SUM(money) FROM coffee_shop_sales WHERE \"date\" BETWEEN DATE('2024-03-01') AND DATE('2024-03-04');"},
+    {"question": "What is the total amount of money spent in the coffee shop between March 1st and March 31st, 2024, "
+                 "grouped by day and cash type?",
+     "sql": "SELECT \"date\" AS operation_day, cash_type, ROUND(SUM(money), 2) AS sales_amount FROM coffee_shop_sales "
+            "WHERE \"date\" BETWEEN DATE('2024-03-01') AND DATE('2024-03-31') GROUP BY \"date\", cash_type ORDER BY 1, 2;"},
+    {"question": "How many coffees of each type were sold?",
+     "sql": "SELECT coffee_name, COUNT(*) AS sold FROM coffee_shop_sales GROUP BY coffee_name ORDER BY sold DESC;"},
+    {"question": "Which coffee brought in the most money paid by card?",
+     "sql": "SELECT coffee_name, ROUND(SUM(money), 2) AS revenue FROM coffee_shop_sales WHERE cash_type = 'card' "
+            "GROUP BY coffee_name ORDER BY revenue DESC LIMIT 1;"},
+    {"question": "What is the average price of a Latte?",
+     "sql": "SELECT ROUND(AVG(money), 2) AS avg_price FROM coffee_shop_sales WHERE coffee_name = 'Latte';"},
+    {"question": "Show me some sales",
+     "sql": "SELECT * FROM coffee_shop_sales LIMIT 10;"},
+]
+
+
+def _snapshot_path(database):
+    return os.path.join(CACHE_DIR, f"schema_{database}.json")
+
+
+def read_catalog_schema(database, tables=None, max_distinct=MAX_DISTINCT_VALUES):
+    """
+    Read tables, columns and low-cardinality values from the Glue catalog and Athena.
+
+    Returns:
+        {"database": ..., "tables": {table: {"columns": [{"name", "type"}], "values": {column: [...]}}}}
+    """
+    import awswrangler as wr
+
+    if tables is None:
+        tables = sorted(wr.catalog.tables(database=database, limit=1000)['Table'])
+    schema = {"database": database, "tables": {}}
+    for table in tables:
+        columns = [{"name": row['Column Name'], "type": row['Type']}
+                   for _, row in wr.catalog.table(database=database, table=table).iterrows()]
+        values = {}
+        for column in columns:
+            if column['type'].lower().startswith(_TEXT_TYPES):
+                df = wr.athena.read_sql_query(
+                    f'SELECT DISTINCT "{column["name"]}" AS v FROM "{table}" LIMIT {max_distinct + 1}',
+                    database=database, ctas_approach=False)
+                distinct = sorted(str(v) for v in df['v'].dropna())
+                if len(distinct) <= max_distinct:
+                    values[column['name']] = distinct
+        schema["tables"][table] = {"columns": columns, "values": values}
+    return schema
+
+
+def load_schema(database, tables=None, refresh=False, snapshot_path=None, max_distinct=MAX_DISTINCT_VALUES):
+    """Schema of a database from the local snapshot, or from the catalog (then saved as the snapshot)"""
+    snapshot_path = snapshot_path or _snapshot_path(database)
+    if not refresh and os.path.exists(snapshot_path):
+        with open(snapshot_path, 'r', encoding='utf-8') as f:
+            schema = json.load(f)
+        if tables is None or set(tables) <= set(schema["tables"]):
+            return schema
+
+    schema = read_catalog_schema(database, tables, max_distinct)
+    os.makedirs(os.path.dirname(os.path.abspath(snapshot_path)), exist_ok=True)
+    with open(snapshot_path, 'w', encoding='utf-8') as f:
+        json.dump(schema, f, indent=2, sort_keys=True)
+    return schema
+
+
+def render_schema(schema):
+    """Deterministic text form of the schema (same schema -> same bytes)"""
+    lines = ["<schema>"]
+    for table in sorted(schema["tables"]):
+        spec = schema["tables"][table]
+        lines.append(f'<table name="{table}">')
+        for column in spec["columns"]:
+            line = f'  {column["name"]} {column["type"].upper()}'
+            values = spec["values"].get(column["name"])
+            if values:
+                line += " -- values: " + ", ".join(f"'{value}'" for value in values)
+            lines.append(line)
+        lines.append("</table>")
+    lines.append("</schema>")
+    return "\n".join(lines)
+
+
+class ExampleSelector:
+    """
+    Picks the k examples whose questions are most similar to a new question.
+
+    Args:
+        examples: List of {"question": ..., "sql": ...}.
+        embed_fn: texts -> (n, d) matrix; defaults to the shared Titan EmbeddingEngine (with disk cache).
+        k: Number of examples to pick.
+    """
+
+    def __init__(self, examples, embed_fn=None, k=2):
+        self.examples = list(examples)
+        self.k = k
+        self.embed_fn = embed_fn or get_embedding_engine(
+            cache_path=os.path.join(CACHE_DIR, "embeddings.sqlite")).embed
+        # The example bank is embedded once
+        self._vectors = self._normalize(self.embed_fn([example["question"] for example in self.examples]))
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1.0, norms)
+
+    def select(self, question):
+        if not self.examples:
+            return []
+        scores = self._vectors @ self._normalize(self.embed_fn([question]))[0]
+        best = np.argsort(-scores, kind='stable')[:self.k]
+        return [self.examples[i] for i in best]
+
+
+class SqlPromptBuilder:
+    """
+    Builds the system prompt (static: rules + schema) and the user message (selected examples + question).
+
+    Args:
+        schema: Output of load_schema.
+        selector: ExampleSelector, or None for no examples.
+        rules: Instructions placed before the schema.
+        cache_point: Add a Bedrock prompt-caching cachePoint after the static system prompt.
+    """
+
+    def __init__(self, schema, selector=None, rules=SQL_RULES, cache_point=False):
+        self.selector = selector
+        self.cache_point = cache_point
+        # Built once: identical bytes on every call
+        self.static_prompt = f"{rules}\n\n{render_schema(schema)}"
+
+    def system_prompts(self, tools_instructions=None):
+        text = self.static_prompt
+        if tools_instructions:
+            text += f"\n\n<tools_use_instructions>\n{tools_instructions.strip()}\n</tools_use_instructions>"
+        system = [{"text": text}]
+        if self.cache_point:
+            system.append({"cachePoint": {"type": "default"}})
+        return system
+
+    def build_messages(self, questions, tools_instructions=None):
+        """
+        User message for the question(s). Without tools_instructions the model is asked to return only
+        the SQL; with them, to run it with the tools (pass the same tools_instructions to system_prompts).
+        """
+        parts = []
+        examples = self.selector.select(questions) if self.selector else []
+        if examples:
+            parts.append("<examples>\n" + "\n".join(
+                f"<question>{example['question']}</question>\n<sql>{example['sql']}</sql>" for example in examples
+            ) + "\n</examples>")
+        parts.append(f"<questions>{questions}</questions>")
+        if tools_instructions:
+            parts.append("Generate the SQL and ALWAYS run it with the run_query tool; never return the SQL itself.")
+        else:
+            parts.append("Return only the SQL statement, ready to execute, and nothing else.")
+        return [{"role": "user", "content": [{"text": "\n\n".join(parts)}]}]
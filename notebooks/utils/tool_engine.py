@@ -0,0 +1,158 @@
+# %%
+"""
+Tool-use engine for the Converse API: a registry of tools, and a loop that runs every toolUse
+block of an assistant turn in parallel.
+
+With parallel tool use the model can ask for several tools (e.g. several SQL queries) in one
+turn. Running them concurrently and answering all of them in one user turn means a question that
+needs N queries costs one extra model round trip instead of N. The loop keeps the whole
+conversation (each assistant turn and each set of tool results) and stops after max_iterations
+model calls or time_budget_seconds; a tool that hangs is answered with an error after
+tool_timeout_seconds.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from loguru import logger
+
+
+class ToolRegistry:
+    """Maps tool names to their Converse toolSpec and a handler(tool_input) -> str"""
+
+    def __init__(self):
+        self._tools = {}
+
+    def register(self, spec, handler):
+        self._tools[spec['name']] = (spec, handler)
+        return handler
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def tool_config(self):
+        """toolConfig for converse() with every registered tool"""
+        return {'tools': [{'toolSpec': spec} for spec, _ in self._tools.values()]}
+
+    def call(self, name, tool_input):
+        if name not in self._tools:
+            raise ValueError(f"Tool {name} not implemented")
+        return self._tools[name][1](tool_input)
+
+
+def _tool_result(tool_use, result, status):
+    return {'toolResult': {'toolUseId': tool_use['toolUseId'],
+                           'content': [{'text': str(result)}],
+                           'status': status}}
+
+
+def _run_tool(registry, tool_use):
+    """Run one toolUse block and return its toolResult block (errors are reported to the model)"""
+    start = time.perf_counter()
+    try:
+        result = registry.call(tool_use['name'], tool_use['input'])
+        status = 'success'
+    except Exception as e:
+        logger.error(f"Tool {tool_use['name']} failed: {e}")
+        result, status = f"Error: {e}", 'error'
+    logger.info(f"Tool {tool_use['name']} ({tool_use['toolUseId']}) finished in {time.perf_counter() - start:.2f}s")
+    return _tool_result(tool_use, result, status)
+
+
+def execute_tool_uses(registry, tool_uses, max_workers=4, timeout_seconds=None):
+    """
+    Run toolUse blocks concurrently; results come back in the same order as the blocks.
+
+    A tool call not finished timeout_seconds after the turn's calls were started is answered with an
+    error result. Python threads can't be killed: the call keeps running in the background, and
+    its late result is discarded.
+    """
+    if len(tool_uses) == 1 and timeout_seconds is None:
+        return [_run_tool(registry, tool_uses[0])]
+    pool = ThreadPoolExecutor(max_workers=min(max_workers, len(tool_uses)))
+    try:
+        futures = [pool.submit(_run_tool, registry, tool_use) for tool_use in tool_uses]
+        deadline = None if timeout_seconds is None else time.monotonic() + timeout_seconds
+        results = []
+        for tool_use, future in zip(tool_uses, futures):
+            try:
+                results.append(future.result(None if deadline is None else max(0.0, deadline - time.monotonic())))
+            except TimeoutError:
+                logger.error(f"Tool {tool_use['name']} ({tool_use['toolUseId']}) timed out after {timeout_seconds}s")
+                results.append(_tool_result(tool_use, f"Error: the tool did not finish in {timeout_seconds} s",
+                                            'error'))
+        return results
+    finally:
+        # Don't wait for timed-out calls; calls that haven't started are cancelled
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _skipped_tool_results(tool_uses, reason):
+    """User turn answering toolUse blocks that won't run, so the history stays valid for converse()"""
+    return {'role': 'user',
+            'content': [_tool_result(tool_use, f"Error: not run, the tool loop stopped ({reason})", 'error')
+                        for tool_use in tool_uses]}
+
+
+def run_tool_loop(converse_fn, messages, registry, max_iterations=5, time_budget_seconds=120, max_workers=4,
+                  on_response=None, tool_timeout_seconds=60):
+    """
+    Call the model, run the tools it asks for, send back the results, and repeat until it answers.
+
+    Args:
+        converse_fn: converse_fn(messages) -> Converse response.
+        messages: Initial conversation (not modified).
+        registry: ToolRegistry with the tools the model may call.
+        max_iterations: Maximum number of model calls.
+        time_budget_seconds: No new model call is started after this time.
+        max_workers: Maximum tools running at the same time.
+        on_response: Optional callback(response) for every model response (e.g. to log token usage).
+        tool_timeout_seconds: Tool calls still running after this time are answered with an error
+            (None waits for them).
+
+    Returns:
+        Dict with the final assistant 'message', the full 'messages' history, the number of
+        'iterations' (model calls), 'tool_calls' and 'stop_reason' ('end_turn', 'max_iterations',
+        'time_budget', or the model's stop reason). When the loop stops with toolUse blocks
+        pending, the history ends with error toolResults for them, so it can be sent to converse() again.
+    """
+    messages = list(messages)
+    deadline = time.monotonic() + time_budget_seconds
+    tool_calls = 0
+    iterations = 0
+    stop_reason = None
+    message = None
+
+    while True:
+        response = converse_fn(messages)
+        iterations += 1
+        if on_response:
+            on_response(response)
+        message = response['output']['message']
+        messages.append(message)
+        stop_reason = response['stopReason']
+
+        tool_uses = [block['toolUse'] for block in message['content'] if 'toolUse' in block]
+        if stop_reason != 'tool_use' or not tool_uses:
+            break
+        if iterations >= max_iterations or time.monotonic() >= deadline:
+            stop_reason = 'max_iterations' if iterations >= max_iterations else 'time_budget'
+            messages.append(_skipped_tool_results(tool_uses, stop_reason))
+            break
+
+        logger.info(f"Running {len(tool_uses)} tool call(s): {[tool_use['name'] for tool_use in tool_uses]}")
+        tool_calls += len(tool_uses)
+        # Every toolUse of the turn must be answered in the next user message
+        messages.append({'role': 'user', 'content': execute_tool_uses(registry, tool_uses, max_workers,
+                                                                      tool_timeout_seconds)})
+        # The tools may have used up the budget: check it again before the next model call
+        if time.monotonic() >= deadline:
+            stop_reason = 'time_budget'
+            break
+
+    if stop_reason in ('max_iterations', 'time_budget'):
+        logger.warning(f"Tool loop stopped ({stop_reason}) after {iterations} model calls and {tool_calls} tool calls")
+    return {'message': message,
+            'messages': messages,
+            'iterations': iterations,
+            'tool_calls': tool_calls,
+            'stop_reason': stop_reason}